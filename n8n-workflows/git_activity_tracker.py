@@ -2,7 +2,7 @@
 """Git Activity Tracker v3 — Autonomous project tracking with velocity predictions.
 
 Pipeline:
-1. Fetch commits from GitHub repos
+1. Fetch commits from GitHub repos (REST API, or local bare mirrors with --backend git)
 2. Query Notion tasks + goals
 3. Claude analyzes commits vs tasks
 4. Update tasks (complete/start)
@@ -11,17 +11,26 @@ Pipeline:
 7. Velocity tracking + delivery predictions
 8. Send intelligent Telegram recap
 
-Run via cron every 6h + post-push hooks.
+Run via cron every 6h + post-push hooks. A per-repo cursor and a ledger of
+processed commits (COMMIT_STATE_FILE) make each commit analyzed once.
 """
 
 import argparse
+import base64
 import fcntl
 import json
 import os
 import re
+import sqlite3
+import subprocess
 import sys
 import requests
+from bisect import bisect_right
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # --- Configuration ---
 def _load_secret(path: str) -> str:
@@ -46,8 +55,30 @@ REPOS = [
 
 HOURS_WINDOW = 7
 LOCKFILE = "/tmp/git_activity_tracker.lock"
-VELOCITY_FILE = "/home/claude-agent/n8n-workflows/velocity_history.json"
+VELOCITY_DB = "/home/claude-agent/n8n-workflows/velocity.db"
+VELOCITY_FILE = "/home/claude-agent/n8n-workflows/velocity_history.json"  # imported into VELOCITY_DB once
+VELOCITY_RETENTION_DAYS = 90
 CHANGELOG_FILE = "/home/claude-agent/n8n-workflows/CHANGELOG.md"
+COMMIT_STATE_FILE = "/home/claude-agent/n8n-workflows/commit_state.json"
+
+# Commit cursor: each run reads from the last processed commit (minus an overlap
+# for commits pushed after their committer date); the ledger skips the overlap.
+CURSOR_OVERLAP_HOURS = 24
+MAX_CATCHUP_DAYS = 7
+LEDGER_DAYS = 14
+REPLAY_SINCE = None   # --replay-since / --replay-until: reprocess a range
+REPLAY_UNTIL = None
+
+COMMITS_PER_PAGE = 100
+MAX_COMMIT_PAGES = 10
+FETCH_WORKERS = 8
+
+# --backend git: bare clones of REPOS, fetched incrementally
+BACKEND = "api"
+MIRROR_DIR = "/home/claude-agent/n8n-workflows/mirrors"
+MIRROR_REMOTE = "https://github.com/{repo}.git"  # {repo} = owner/name, {name} = name
+GIT_TIMEOUT = 120
+MAX_FILES_PER_COMMIT = 8
 
 GH_HEADERS = {
     "Authorization": f"Bearer {GITHUB_TOKEN}",
@@ -56,30 +87,281 @@ GH_HEADERS = {
 }
 
 
+def _make_session() -> requests.Session:
+    """Keep-alive session shared by every call (GitHub, Anthropic, n8n).
+
+    Connection failures, 429 and 503 are retried with backoff, including POSTs:
+    in those cases the request was not processed. Other errors are not retried."""
+    retry = Retry(total=3, connect=3, read=0, status=3, backoff_factor=0.5,
+                  status_forcelist=(429, 503), allowed_methods=None,
+                  respect_retry_after_header=True, raise_on_status=False)
+    session = requests.Session()
+    session.mount("https://", HTTPAdapter(pool_maxsize=8, max_retries=retry))
+    return session
+
+
+HTTP = _make_session()
+
+
 def log(msg: str) -> None:
     print(f"[{datetime.now().strftime('%H:%M:%S')}] {msg}")
 
 
 # --- Data Fetching ---
 
-def fetch_commits(repo: str, since: str) -> list[dict]:
-    """Fetch commits from a GitHub repo since a given time."""
+def _parse_ts(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _as_utc(value: str) -> str:
+    """ISO date or datetime from the command line, as an aware ISO timestamp (UTC if no offset)."""
+    ts = _parse_ts(value)
+    return (ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)).isoformat()
+
+
+def _commit_time(commit: dict) -> datetime:
+    """Committer date: the one GitHub's `since` filters and orders on."""
+    info = commit.get("commit", {})
+    return _parse_ts((info.get("committer") or info.get("author") or {}).get("date") or "1970-01-01T00:00:00Z")
+
+
+def _slim_commit(commit: dict) -> dict:
+    """The fields the tracker uses, for the commit state file."""
+    info = commit.get("commit", {})
+    return {
+        "sha": commit.get("sha", ""),
+        "commit": {
+            "message": info.get("message", ""),
+            "author": {k: (info.get("author") or {}).get(k, "") for k in ("name", "date")},
+            "committer": {"date": (info.get("committer") or {}).get("date", "")},
+        },
+    }
+
+
+def load_commit_state() -> dict:
+    """Per-repo state: ETag, last seen SHA and commits of the last window (api
+    backend), plus the cursor and the processed-commit ledger."""
+    try:
+        with open(COMMIT_STATE_FILE) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+
+
+def save_commit_state(state: dict) -> None:
+    tmp = f"{COMMIT_STATE_FILE}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, indent=1)
+    os.replace(tmp, COMMIT_STATE_FILE)
+
+
+def fetch_commits(repo: str, since: str, repo_state: dict | None = None) -> list[dict]:
+    """Fetch commits from a GitHub repo since a given time, newest first.
+
+    Once a SHA is known, always requests the same first page (no `since` in
+    the URL) so its ETag stays valid: an unchanged repo answers 304, which
+    costs no rate limit, and the commits come from repo_state. Otherwise pages
+    are followed (Link header) down to the last seen SHA, keeping the commits
+    dated after `since`; commit dates are not monotonic along the history, so
+    an older commit does not end the walk. Without a known SHA, GitHub filters
+    on `since` itself. repo_state is updated in place."""
     url = f"https://api.github.com/repos/{repo}/commits"
+    name = repo.split("/")[-1]
+    since_ts = _parse_ts(since)
+    state = repo_state if repo_state is not None else {}
+    # The cached commits are complete from covered_since onwards
+    usable = bool(state.get("covered_since")) and _parse_ts(state["covered_since"]) <= since_ts
+    cached = [c for c in state.get("commits", []) if _commit_time(c) >= since_ts] if usable else []
+
+    last_sha = state.get("last_sha") if usable else None
+    headers = dict(GH_HEADERS)
+    params = {"per_page": COMMITS_PER_PAGE}
+    if last_sha and state.get("etag"):
+        headers["If-None-Match"] = state["etag"]
+    elif not last_sha:
+        params["since"] = since
     try:
-        r = requests.get(url, headers=GH_HEADERS, params={"since": since, "per_page": 50}, timeout=15)
-        if r.status_code == 200:
-            return r.json()
-        log(f"  [{repo.split('/')[-1]}] HTTP {r.status_code}")
-        return []
+        r = HTTP.get(url, headers=headers, params=params, timeout=15)
+        if r.status_code == 304:
+            state["commits"] = cached
+            state["covered_since"] = since
+            return cached
+        if r.status_code != 200:
+            log(f"  [{name}] HTTP {r.status_code}")
+            return []
+        # An ETag for the `since` URL would never match the next run's request
+        etag = r.headers.get("ETag") if last_sha else None
+        new, reached_known, head = [], False, None
+        for page_no in range(1, MAX_COMMIT_PAGES + 1):
+            page = r.json()
+            if page_no == 1 and page:
+                head = page[0].get("sha")
+            for c in page:
+                if last_sha and c.get("sha") == last_sha:
+                    reached_known = True
+                    break
+                if _commit_time(c) >= since_ts:
+                    new.append(c)
+            else:
+                next_url = r.links.get("next", {}).get("url")
+                if next_url and page:
+                    r = HTTP.get(next_url, headers=GH_HEADERS, timeout=15)
+                    if r.status_code == 200:
+                        continue
+                    log(f"  [{name}] HTTP {r.status_code} on page {page_no + 1}, window truncated")
+            break
+        else:
+            log(f"  [{name}] more than {MAX_COMMIT_PAGES * COMMITS_PER_PAGE} commits, window truncated")
     except Exception as e:
-        log(f"  [{repo.split('/')[-1]}] Error: {e}")
+        log(f"  [{name}] Error: {e}")
+        return []
+
+    commits = new + (cached if reached_known else [])
+    state.update({
+        "etag": etag,
+        "last_sha": head,
+        "covered_since": since,
+        "commits": [_slim_commit(c) for c in commits],
+    })
+    return commits
+
+
+def _git(*args: str, cwd: str | None = None) -> str:
+    """Run git and return stdout. The GitHub token goes through the environment
+    (not argv, which other users can read) as an auth header for github.com."""
+    auth = base64.b64encode(f"x-access-token:{GITHUB_TOKEN}".encode()).decode()
+    env = dict(os.environ, GIT_TERMINAL_PROMPT="0", GIT_CONFIG_COUNT="1",
+               GIT_CONFIG_KEY_0="http.https://github.com/.extraheader",
+               GIT_CONFIG_VALUE_0=f"Authorization: Basic {auth}")
+    return subprocess.run(["git", *args], cwd=cwd, env=env, check=True, capture_output=True,
+                          text=True, timeout=GIT_TIMEOUT).stdout
+
+
+def mirror_path(repo: str) -> str:
+    return os.path.join(MIRROR_DIR, repo.replace("/", "__") + ".git")
+
+
+def sync_mirror(repo: str) -> str:
+    """Clone the bare mirror on first use, then fetch only new objects. Returns its path."""
+    path = mirror_path(repo)
+    if not os.path.isdir(path):
+        os.makedirs(MIRROR_DIR, exist_ok=True)
+        remote = MIRROR_REMOTE.format(repo=repo, name=repo.split("/")[-1])
+        _git("clone", "--bare", "--quiet", remote, path)
+    else:
+        _git("fetch", "--quiet", "--prune", "origin", "+refs/heads/*:refs/heads/*", cwd=path)
+    return path
+
+
+def _parse_numstat(lines: str) -> list[dict]:
+    files = []
+    for line in lines.splitlines():
+        parts = line.split("\t", 2)
+        if len(parts) != 3:
+            continue
+        added, deleted, filename = parts
+        # Binary files show "-" instead of line counts
+        added, deleted = int(added) if added.isdigit() else 0, int(deleted) if deleted.isdigit() else 0
+        files.append({"filename": filename, "additions": added, "deletions": deleted,
+                      "changes": added + deleted})
+    return files
+
+
+def read_mirror_commits(path: str, since: str) -> list[dict]:
+    """Commits on the default branch since `since`, newest first, in the REST API
+    shape plus "files" (changed paths with line counts) and "stats"."""
+    since_epoch = int(_parse_ts(since).timestamp())
+    out = _git("log", "HEAD", f"--since=@{since_epoch}", "--no-renames", "--numstat",
+               "--format=%x1e%H%x1f%an%x1f%aI%x1f%cI%x1f%B%x1f", cwd=path)
+    commits = []
+    for record in out.split("\x1e")[1:]:
+        sha, author, authored, committed, message, numstat = record.split("\x1f", 5)
+        files = _parse_numstat(numstat)
+        additions = sum(f["additions"] for f in files)
+        deletions = sum(f["deletions"] for f in files)
+        commits.append({
+            "sha": sha,
+            "commit": {
+                "message": message.strip(),
+                "author": {"name": author, "date": authored},
+                "committer": {"date": committed},
+            },
+            "stats": {"additions": additions, "deletions": deletions, "total": additions + deletions},
+            "files": files,
+        })
+    return commits
+
+
+def fetch_commits_git(repo: str, since: str) -> list[dict]:
+    """fetch_commits from the local mirror. A failed fetch (offline) reads what is already mirrored."""
+    name = repo.split("/")[-1]
+    try:
+        path = sync_mirror(repo)
+    except (subprocess.SubprocessError, OSError) as e:
+        path = mirror_path(repo)
+        err = getattr(e, "stderr", None) or e
+        log(f"  [{name}] git fetch failed: {' '.join(str(err).split())[:200]}")
+        if not os.path.isdir(path):
+            return []
+    try:
+        return read_mirror_commits(path, since)
+    except (subprocess.SubprocessError, OSError, ValueError) as e:
+        log(f"  [{name}] git log error: {e}")
         return []
 
 
+def fetch_all_commits(repos: list[str], since: dict[str, str], state: dict) -> dict[str, list]:
+    """Commits of every repo since since[repo], in parallel, from BACKEND; state holds one entry per repo."""
+    repo_states = {repo: state.setdefault(repo, {}) for repo in repos}
+
+    def fetch(repo: str) -> list[dict]:
+        if BACKEND == "git":
+            return fetch_commits_git(repo, since[repo])
+        return fetch_commits(repo, since[repo], repo_states[repo])
+
+    with ThreadPoolExecutor(max_workers=min(FETCH_WORKERS, len(repos) or 1)) as pool:
+        return dict(zip(repos, pool.map(fetch, repos)))
+
+
+def repo_since(repo_state: dict, now: datetime) -> str:
+    """Start of the fetch window: the cursor minus the overlap, or HOURS_WINDOW on a first run."""
+    cursor = repo_state.get("cursor")
+    if not cursor:
+        return (now - timedelta(hours=HOURS_WINDOW)).isoformat()
+    start = _parse_ts(cursor["date"]) - timedelta(hours=CURSOR_OVERLAP_HOURS)
+    return max(start, now - timedelta(days=MAX_CATCHUP_DAYS)).isoformat()
+
+
+def unprocessed(commits: list[dict], repo_state: dict) -> list[dict]:
+    """Commits not in the ledger yet."""
+    ledger = repo_state.get("processed", {})
+    return [c for c in commits if c.get("sha") not in ledger]
+
+
+def mark_processed(all_commits: dict[str, list], state: dict, now: datetime) -> None:
+    """Add commits to each repo's ledger, advance its cursor and drop old ledger entries."""
+    cutoff = (now - timedelta(days=LEDGER_DAYS)).isoformat()
+    stamp = now.isoformat()
+    for repo, commits in all_commits.items():
+        repo_state = state.setdefault(repo, {})
+        ledger = repo_state.setdefault("processed", {})
+        for c in commits:
+            ledger[c["sha"]] = stamp
+        repo_state["processed"] = {sha: at for sha, at in ledger.items() if at >= cutoff}
+        if not commits:
+            continue
+        newest = max(commits, key=_commit_time)
+        cursor = repo_state.get("cursor")
+        if not cursor or _commit_time(newest) > _parse_ts(cursor["date"]):
+            info = newest["commit"]
+            repo_state["cursor"] = {"sha": newest["sha"],
+                                    "date": (info.get("committer") or info["author"])["date"]}
+
+
 def fetch_notion_tasks() -> list[dict]:
     """Fetch active tasks with relations from Notion."""
     try:
-        r = requests.post(NOTION_QUERY_URL, json={}, timeout=30)
+        r = HTTP.post(NOTION_QUERY_URL, json={}, timeout=30)
         if r.status_code != 200:
             log(f"  Notion tasks HTTP {r.status_code}")
             return []
@@ -92,7 +374,7 @@ def fetch_notion_tasks() -> list[dict]:
 def fetch_notion_goals() -> list[dict]:
     """Fetch active goals from Notion."""
     try:
-        r = requests.post(NOTION_GOALS_URL, json={}, timeout=30)
+        r = HTTP.post(NOTION_GOALS_URL, json={}, timeout=30)
         if r.status_code != 200:
             log(f"  Notion goals HTTP {r.status_code}")
             return []
@@ -105,7 +387,7 @@ def fetch_notion_goals() -> list[dict]:
 def update_notion_page(page_id: str, properties: dict) -> bool:
     """Update any Notion page's properties via webhook."""
     try:
-        r = requests.post(NOTION_UPDATE_URL, json={
+        r = HTTP.post(NOTION_UPDATE_URL, json={
             "page_id": page_id,
             "properties": properties
         }, timeout=15)
@@ -129,7 +411,7 @@ def create_notion_task(task: dict) -> bool:
         "category": category_map.get(task.get("category", "Business"), "\U0001f4bc Business"),
     }
     try:
-        r = requests.post(NOTION_CREATE_URL, json=payload, timeout=15)
+        r = HTTP.post(NOTION_CREATE_URL, json=payload, timeout=15)
         return r.status_code == 200
     except Exception as e:
         log(f"  Create error: {e}")
@@ -152,6 +434,12 @@ def build_git_summary(all_commits: dict[str, list]) -> tuple[str, int]:
             date = c.get("commit", {}).get("author", {}).get("date", "")[:16]
             sha = c.get("sha", "")[:7]
             summary += f"- [{sha}] {date} — {msg}\n"
+            files = c.get("files")
+            if files:
+                shown = ", ".join(f"{f['filename']} (+{f['additions']}/-{f['deletions']})"
+                                  for f in files[:MAX_FILES_PER_COMMIT])
+                more = f" +{len(files) - MAX_FILES_PER_COMMIT} more" if len(files) > MAX_FILES_PER_COMMIT else ""
+                summary += f"  files: {shown}{more}\n"
             total += 1
     return summary, total
 
@@ -210,7 +498,7 @@ Regles :
     }
 
     try:
-        r = requests.post(
+        r = HTTP.post(
             "https://api.anthropic.com/v1/messages",
             headers={
                 "x-api-key": ANTHROPIC_KEY,
@@ -262,7 +550,7 @@ Sois concis — max 10 lignes."""
     }
 
     try:
-        r = requests.post(
+        r = HTTP.post(
             "https://api.anthropic.com/v1/messages",
             headers={
                 "x-api-key": ANTHROPIC_KEY,
@@ -496,27 +784,104 @@ def check_deadlines(tasks: list[dict], goals: list[dict]) -> list[dict]:
 
 # --- Velocity Tracking & Predictions ---
 
-def load_velocity_history() -> dict:
-    """Load velocity history from JSON file."""
-    if os.path.exists(VELOCITY_FILE):
+_VELOCITY_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    ts REAL NOT NULL,
+    source TEXT NOT NULL DEFAULT '',
+    commits INTEGER NOT NULL DEFAULT 0,
+    tasks_completed INTEGER NOT NULL DEFAULT 0,
+    tasks_started INTEGER NOT NULL DEFAULT 0,
+    tasks_created INTEGER NOT NULL DEFAULT 0,
+    total_active_tasks INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS project_snapshots (
+    run_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    project_id TEXT NOT NULL,
+    name TEXT,
+    status TEXT,
+    tasks_done INTEGER,
+    tasks_total INTEGER,
+    progress REAL
+);
+CREATE TABLE IF NOT EXISTS goal_snapshots (
+    run_id INTEGER NOT NULL,
+    ts REAL NOT NULL,
+    goal_id TEXT NOT NULL,
+    name TEXT,
+    progress REAL,
+    target_date TEXT,
+    status TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_ts ON runs (ts);
+CREATE INDEX IF NOT EXISTS project_snapshots_ts ON project_snapshots (ts);
+CREATE INDEX IF NOT EXISTS project_snapshots_project ON project_snapshots (project_id, ts);
+CREATE INDEX IF NOT EXISTS goal_snapshots_ts ON goal_snapshots (ts);
+CREATE INDEX IF NOT EXISTS goal_snapshots_goal ON goal_snapshots (goal_id, ts);
+"""
+
+
+def open_velocity_store(path: str | None = None) -> sqlite3.Connection:
+    """Open the velocity store (one row per run, one per project/goal snapshot),
+    importing VELOCITY_FILE on first use."""
+    conn = sqlite3.connect(path or VELOCITY_DB)
+    conn.executescript(_VELOCITY_SCHEMA)
+    if os.path.exists(VELOCITY_FILE) and conn.execute("SELECT 1 FROM runs LIMIT 1").fetchone() is None:
         try:
-            with open(VELOCITY_FILE, "r") as f:
-                return json.load(f)
+            with open(VELOCITY_FILE) as f:
+                runs = json.load(f).get("runs", [])
         except (json.JSONDecodeError, IOError):
-            pass
-    return {"runs": []}
+            runs = []
+        with conn:
+            for run in runs:
+                try:
+                    ts = _parse_ts(run["timestamp"]).timestamp()
+                except (KeyError, TypeError, ValueError):
+                    continue
+                _insert_run(conn, ts, run)
+        os.replace(VELOCITY_FILE, f"{VELOCITY_FILE}.migrated")
+        log(f"  Velocity history migrated to {path or VELOCITY_DB} ({len(runs)} runs)")
+    return conn
+
+
+def _insert_run(conn: sqlite3.Connection, ts: float, run: dict) -> None:
+    run_id = conn.execute(
+        "INSERT INTO runs (ts, source, commits, tasks_completed, tasks_started, tasks_created, "
+        "total_active_tasks) VALUES (?, ?, ?, ?, ?, ?, ?)",
+        (ts, run.get("source", ""), run.get("commits", 0), run.get("tasks_completed", 0),
+         run.get("tasks_started", 0), run.get("tasks_created", 0), run.get("total_active_tasks", 0)),
+    ).lastrowid
+    conn.executemany(
+        "INSERT INTO project_snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [(run_id, ts, pid, p.get("name"), p.get("status"), p.get("tasks_done"), p.get("tasks_total"),
+          p.get("progress")) for pid, p in run.get("project_snapshots", {}).items()],
+    )
+    conn.executemany(
+        "INSERT INTO goal_snapshots VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(run_id, ts, gid, g.get("name"), g.get("progress"), g.get("target_date"), g.get("status"))
+         for gid, g in run.get("goal_snapshots", {}).items()],
+    )
+
 
+def project_children(tasks: list[dict]) -> dict[str, list[dict]]:
+    """Map project ID -> its non-project child tasks (through "upstream"), in one pass."""
+    projects = {t["id"] for t in tasks if t["type"] == "Project"}
+    children: dict[str, list[dict]] = {}
+    for t in tasks:
+        if t["type"] != "Project":
+            for parent_id in dict.fromkeys(t.get("upstream", [])):
+                if parent_id in projects:
+                    children.setdefault(parent_id, []).append(t)
+    return children
 
-def save_velocity_history(history: dict) -> None:
-    """Save velocity history to JSON file. Keep last 90 days."""
-    cutoff = (datetime.now(timezone.utc) - timedelta(days=90)).isoformat()
-    history["runs"] = [r for r in history["runs"] if r.get("timestamp", "") > cutoff]
-    with open(VELOCITY_FILE, "w") as f:
-        json.dump(history, f, indent=2, default=str)
+
+def count_runs(store: sqlite3.Connection) -> int:
+    return store.execute("SELECT COUNT(*) FROM runs").fetchone()[0]
 
 
 def record_velocity(
-    history: dict,
+    store: sqlite3.Connection,
     total_commits: int,
     tasks: list[dict],
     goals: list[dict],
@@ -525,13 +890,15 @@ def record_velocity(
     created_count: int,
     source: str,
 ) -> None:
-    """Record a velocity data point."""
+    """Record a velocity data point and drop runs older than VELOCITY_RETENTION_DAYS."""
     # Snapshot project progress
     project_snapshots = {}
+    children_by_project = project_children(tasks)
+    completed = set(completed_ids)
     for t in tasks:
         if t["type"] == "Project":
-            children = [c for c in tasks if t["id"] in c.get("upstream", []) and c["type"] != "Project"]
-            done = sum(1 for c in children if c["status"] == "Complete" or c["id"] in completed_ids)
+            children = children_by_project.get(t["id"], [])
+            done = sum(1 for c in children if c["status"] == "Complete" or c["id"] in completed)
             total = len(children)
             project_snapshots[t["id"]] = {
                 "name": t["name"],
@@ -551,57 +918,63 @@ def record_velocity(
             "status": g.get("status", ""),
         }
 
-    history["runs"].append({
-        "timestamp": datetime.now(timezone.utc).isoformat(),
-        "source": source,
-        "commits": total_commits,
-        "tasks_completed": len(completed_ids),
-        "tasks_started": len(started_ids),
-        "tasks_created": created_count,
-        "total_active_tasks": len([t for t in tasks if t["type"] != "Project"]),
-        "project_snapshots": project_snapshots,
-        "goal_snapshots": goal_snapshots,
-    })
-
-
-def calculate_velocity(history: dict, days: int = 7) -> dict:
-    """Calculate velocity metrics over the last N days.
-
-    Returns: {
-        "tasks_per_day": float,
-        "commits_per_day": float,
-        "data_points": int,
-        "days_covered": int,
-    }
-    """
-    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
-    recent = [r for r in history["runs"] if r.get("timestamp", "") > cutoff]
-
-    if not recent:
-        return {"tasks_per_day": 0, "commits_per_day": 0, "data_points": 0, "days_covered": 0}
-
-    total_tasks = sum(r.get("tasks_completed", 0) for r in recent)
-    total_commits = sum(r.get("commits", 0) for r in recent)
+    now = datetime.now(timezone.utc).timestamp()
+    cutoff = now - VELOCITY_RETENTION_DAYS * 86400
+    with store:
+        _insert_run(store, now, {
+            "source": source,
+            "commits": total_commits,
+            "tasks_completed": len(completed_ids),
+            "tasks_started": len(started_ids),
+            "tasks_created": created_count,
+            "total_active_tasks": len([t for t in tasks if t["type"] != "Project"]),
+            "project_snapshots": project_snapshots,
+            "goal_snapshots": goal_snapshots,
+        })
+        # Retention: range deletes on the ts indexes
+        for table in ("runs", "project_snapshots", "goal_snapshots"):
+            store.execute(f"DELETE FROM {table} WHERE ts < ?", (cutoff,))
+
+
+def velocity_windows(store: sqlite3.Connection, windows: tuple[int, ...] = (7, 14, 30)) -> dict[int, dict]:
+    """Velocity metrics for each window (in days), from one read of the longest one.
+
+    Runs come back sorted by ts; prefix sums of tasks and commits give each
+    window's totals, and bisect finds where it starts.
+    Returns {days: {"tasks_per_day", "commits_per_day", "data_points", "days_covered"}}."""
+    now = datetime.now(timezone.utc).timestamp()
+    rows = store.execute(
+        "SELECT ts, tasks_completed, commits FROM runs WHERE ts > ? ORDER BY ts",
+        (now - max(windows) * 86400,),
+    ).fetchall()
+    stamps = [r[0] for r in rows]
+    tasks_sum = list(accumulate((r[1] for r in rows), initial=0))
+    commits_sum = list(accumulate((r[2] for r in rows), initial=0))
+
+    result = {}
+    for days in windows:
+        start = bisect_right(stamps, now - days * 86400)
+        n = len(stamps) - start
+        if not n:
+            result[days] = {"tasks_per_day": 0, "commits_per_day": 0, "data_points": 0, "days_covered": 0}
+            continue
+        days_covered = max((stamps[-1] - stamps[start]) / 86400, 1)
+        result[days] = {
+            "tasks_per_day": (tasks_sum[-1] - tasks_sum[start]) / days_covered,
+            "commits_per_day": (commits_sum[-1] - commits_sum[start]) / days_covered,
+            "data_points": n,
+            "days_covered": round(days_covered, 1),
+        }
+    return result
 
-    # Calculate actual days covered
-    timestamps = [r["timestamp"] for r in recent]
-    try:
-        first = datetime.fromisoformat(min(timestamps))
-        last = datetime.fromisoformat(max(timestamps))
-        days_covered = max((last - first).total_seconds() / 86400, 1)
-    except (ValueError, TypeError):
-        days_covered = days
 
-    return {
-        "tasks_per_day": total_tasks / days_covered if days_covered > 0 else 0,
-        "commits_per_day": total_commits / days_covered if days_covered > 0 else 0,
-        "data_points": len(recent),
-        "days_covered": round(days_covered, 1),
-    }
+def calculate_velocity(store: sqlite3.Connection, days: int = 7) -> dict:
+    """Velocity metrics over the last N days (see velocity_windows)."""
+    return velocity_windows(store, (days,))[days]
 
 
 def predict_deliveries(
-    history: dict,
+    history: sqlite3.Connection,
     tasks: list[dict],
     goals: list[dict],
     completed_ids: list[str],
@@ -614,9 +987,8 @@ def predict_deliveries(
     predictions = []
 
     # Calculate velocity over different windows
-    v7 = calculate_velocity(history, 7)
-    v14 = calculate_velocity(history, 14)
-    v30 = calculate_velocity(history, 30)
+    windows = velocity_windows(history, (7, 14, 30))
+    v7, v14, v30 = windows[7], windows[14], windows[30]
 
     # Use the best available velocity (prefer 14-day, fallback to 7 or 30)
     if v14["data_points"] >= 3:
@@ -634,19 +1006,31 @@ def predict_deliveries(
 
     tasks_per_day = velocity["tasks_per_day"]
 
+    # Indexes built once: children per project, parsed goal deadlines in goals order
+    children_by_project = project_children(tasks)
+    completed = set(completed_ids)
+    goal_order = {g["id"]: i for i, g in enumerate(goals)}
+    goal_deadlines = {}
+    for g in goals:
+        if g.get("target_date"):
+            try:
+                goal_deadlines[g["id"]] = (datetime.fromisoformat(g["target_date"].replace("Z", "+00:00")).date(),
+                                           g["name"])
+            except (ValueError, AttributeError):
+                pass
+
     # --- Project predictions ---
     for t in tasks:
         if t["type"] != "Project" or t["status"] in ("Complete", "Archive"):
             continue
 
-        # Find children tasks
-        children = [c for c in tasks if t["id"] in c.get("upstream", []) and c["type"] != "Project"]
+        children = children_by_project.get(t["id"])
         if not children:
             continue
 
         remaining = sum(
             1 for c in children
-            if c["status"] not in ("Complete",) and c["id"] not in completed_ids
+            if c["status"] not in ("Complete",) and c["id"] not in completed
         )
         total = len(children)
         done = total - remaining
@@ -664,17 +1048,13 @@ def predict_deliveries(
             except (ValueError, AttributeError):
                 pass
 
-        # Also check linked goals for deadline
-        for g in goals:
-            goal_children = [c for c in tasks if g["id"] in c.get("goals", [])]
-            if t["id"] in [c["id"] for c in goal_children] and g.get("target_date"):
-                try:
-                    goal_deadline = datetime.fromisoformat(g["target_date"].replace("Z", "+00:00")).date()
-                    if deadline is None or goal_deadline < deadline:
-                        deadline = goal_deadline
-                        deadline_source = g["name"]
-                except (ValueError, AttributeError):
-                    pass
+        # Also check linked goals for deadline (earliest wins, first goal on ties)
+        linked = sorted({gid for gid in t.get("goals", []) if gid in goal_deadlines}, key=goal_order.get)
+        for gid in linked:
+            goal_deadline, goal_name = goal_deadlines[gid]
+            if deadline is None or goal_deadline < deadline:
+                deadline = goal_deadline
+                deadline_source = goal_name
 
         # Predict
         if tasks_per_day > 0:
@@ -718,6 +1098,7 @@ def predict_deliveries(
         predictions.append(pred)
 
     # --- Goal predictions (based on progress velocity) ---
+    progress_velocities = _progress_velocities(history, days=14)
     for g in goals:
         if g.get("status") in ("Achieved", "Abandoned"):
             continue
@@ -738,8 +1119,7 @@ def predict_deliveries(
         if days_left <= 0:
             continue  # Already handled by deadline alerts
 
-        # Calculate progress velocity from history
-        progress_velocity = _calc_progress_velocity(history, g["id"], days=14)
+        progress_velocity = progress_velocities.get(g["id"], 0)
 
         if progress_velocity > 0:
             days_to_100 = remaining_progress / progress_velocity
@@ -781,36 +1161,31 @@ def predict_deliveries(
     return predictions
 
 
-def _calc_progress_velocity(history: dict, goal_id: str, days: int = 14) -> float:
-    """Calculate how fast a goal's progress is changing (per day)."""
-    cutoff = (datetime.now(timezone.utc) - timedelta(days=days)).isoformat()
-    recent = [r for r in history["runs"] if r.get("timestamp", "") > cutoff]
-
-    # Find snapshots for this goal
-    snapshots = []
-    for r in recent:
-        gs = r.get("goal_snapshots", {}).get(goal_id)
-        if gs and gs.get("progress") is not None:
-            snapshots.append((r["timestamp"], gs["progress"]))
-
-    if len(snapshots) < 2:
-        return 0
-
-    snapshots.sort(key=lambda x: x[0])
-    first_time = datetime.fromisoformat(snapshots[0][0])
-    last_time = datetime.fromisoformat(snapshots[-1][0])
-    first_progress = snapshots[0][1]
-    last_progress = snapshots[-1][1]
-
-    elapsed_days = (last_time - first_time).total_seconds() / 86400
-    if elapsed_days < 0.1:
-        return 0
-
-    delta = last_progress - first_progress
-    if delta <= 0:
-        return 0
-
-    return delta / elapsed_days
+def _progress_velocities(store: sqlite3.Connection, days: int = 14) -> dict[str, float]:
+    """How fast each goal's progress is changing (per day), for all goals in one query.
+
+    Uses the first and last snapshot of each goal in the window; goals without
+    growth over at least 0.1 day are left out."""
+    cutoff = datetime.now(timezone.utc).timestamp() - days * 86400
+    rows = store.execute(
+        "SELECT goal_id, MIN(ts), MAX(ts) FROM goal_snapshots "
+        "WHERE ts > ? AND progress IS NOT NULL GROUP BY goal_id",
+        (cutoff,),
+    ).fetchall()
+    progress_at = dict(((gid, ts), progress) for gid, ts, progress in store.execute(
+        "SELECT goal_id, ts, progress FROM goal_snapshots WHERE ts > ? AND progress IS NOT NULL",
+        (cutoff,),
+    ))
+
+    velocities = {}
+    for goal_id, first, last in rows:
+        elapsed_days = (last - first) / 86400
+        if elapsed_days < 0.1:
+            continue
+        delta = progress_at[(goal_id, last)] - progress_at[(goal_id, first)]
+        if delta > 0:
+            velocities[goal_id] = delta / elapsed_days
+    return velocities
 
 
 # --- Telegram Recap ---
@@ -926,7 +1301,7 @@ def send_recap(analysis: dict, total_commits: int, highlights: list[str],
         "duration_hours": 0,
     }
     try:
-        r = requests.post(SESSION_CLOSER_URL, json=payload, timeout=30)
+        r = HTTP.post(SESSION_CLOSER_URL, json=payload, timeout=30)
         return r.status_code == 200
     except Exception as e:
         log(f"  Session Closer error: {e}")
@@ -938,17 +1313,29 @@ def send_recap(analysis: dict, total_commits: int, highlights: list[str],
 def main(source: str = "cron") -> dict:
     log("=== Git Activity Tracker v3 ===")
 
-    # 1. Time window
-    since = (datetime.now(timezone.utc) - timedelta(hours=HOURS_WINDOW)).isoformat()
-    log(f"Window: last {HOURS_WINDOW}h")
+    # 1. Time window: from each repo's cursor, or the replayed range
+    now = datetime.now(timezone.utc)
+    commit_state = load_commit_state()
+    if REPLAY_SINCE:
+        since = {repo: REPLAY_SINCE for repo in REPOS}
+        log(f"Replay: {REPLAY_SINCE} -> {REPLAY_UNTIL or 'now'}")
+    else:
+        since = {repo: repo_since(commit_state.get(repo, {}), now) for repo in REPOS}
+        log(f"Window: from cursor ({HOURS_WINDOW}h on first run)")
 
-    # 2. Fetch commits
-    log("Fetching commits...")
+    # 2. Fetch commits, keeping only those not processed yet
+    log(f"Fetching commits ({BACKEND})...")
+    fetched = fetch_all_commits(REPOS, since, commit_state)
+    save_commit_state(commit_state)
     all_commits = {}
-    for repo in REPOS:
-        commits = fetch_commits(repo, since)
-        all_commits[repo] = commits
-        log(f"  {repo.split('/')[-1]}: {len(commits)} commits")
+    for repo, commits in fetched.items():
+        if REPLAY_SINCE:
+            until = _parse_ts(REPLAY_UNTIL) if REPLAY_UNTIL else now
+            all_commits[repo] = [c for c in commits if _commit_time(c) <= until]
+        else:
+            all_commits[repo] = unprocessed(commits, commit_state[repo])
+        log(f"  {repo.split('/')[-1]}: {len(all_commits[repo])} commits "
+            f"({len(commits) - len(all_commits[repo])} skipped)")
 
     git_summary, total_commits = build_git_summary(all_commits)
 
@@ -959,10 +1346,10 @@ def main(source: str = "cron") -> dict:
         alerts = check_deadlines(tasks, goals)
 
         # Record velocity snapshot even without commits
-        history = load_velocity_history()
+        history = open_velocity_store()
         record_velocity(history, 0, tasks, goals, [], [], 0, source=source)
-        save_velocity_history(history)
-        log(f"  Velocity snapshot saved ({len(history['runs'])} total points)")
+        log(f"  Velocity snapshot saved ({count_runs(history)} total points)")
+        history.close()
 
         overdue = [a for a in alerts if a["type"] == "overdue"]
         if overdue:
@@ -1003,10 +1390,12 @@ def main(source: str = "cron") -> dict:
     started_ids = analysis.get("tasks_started", [])
     to_create = analysis.get("tasks_to_create", [])
     log(f"  Completed: {len(completed_ids)} | Started: {len(started_ids)} | New: {len(to_create)}")
+    # A failed analysis leaves the commits for the next run: nothing here may count them
+    analysis_failed = analysis.get("summary") == "Error"
 
     # 4b. Generate changelog
     log("Generating changelog...")
-    changelog_entry = generate_changelog(git_summary, analysis)
+    changelog_entry = None if analysis_failed else generate_changelog(git_summary, analysis)
     if changelog_entry:
         save_changelog(changelog_entry, total_commits)
         # Extract first line for recap
@@ -1014,7 +1403,7 @@ def main(source: str = "cron") -> dict:
         log(f"  Saved: {changelog_oneliner[:80]}")
     else:
         changelog_oneliner = None
-        log("  Skipped (no meaningful changes)")
+        log(f"  Skipped ({'analysis failed' if analysis_failed else 'no meaningful changes'})")
 
     # 5. Create new tasks
     for task in to_create:
@@ -1062,13 +1451,19 @@ def main(source: str = "cron") -> dict:
 
     # 9. Velocity tracking & predictions
     log("Velocity tracking...")
-    history = load_velocity_history()
+    history = open_velocity_store()
     record_velocity(
-        history, total_commits, tasks, goals,
+        history, 0 if analysis_failed else total_commits, tasks, goals,
         completed_ids, started_ids, len(to_create),
         source=source,
     )
-    save_velocity_history(history)
+
+    # Commits are done once analyzed and written to Notion; a failed analysis is retried next run
+    if analysis_failed:
+        log("  Analysis failed: commits left unprocessed")
+    else:
+        mark_processed(all_commits, commit_state, now)
+        save_commit_state(commit_state)
 
     v14 = calculate_velocity(history, 14)
     log(f"  Velocity (14j): {v14['tasks_per_day']:.2f} taches/jour, "
@@ -1076,6 +1471,7 @@ def main(source: str = "cron") -> dict:
 
     log("Predicting deliveries...")
     predictions = predict_deliveries(history, tasks, goals, completed_ids)
+    history.close()
     for pred in predictions:
         if pred["status"] == "PAS ASSEZ DE DONNEES":
             log(f"  [{pred['kind']}] {pred['name']}: pas assez de donnees")
@@ -1124,11 +1520,22 @@ def main(source: str = "cron") -> dict:
 def parse_args():
     parser = argparse.ArgumentParser(description="Git Activity Tracker v2")
     parser.add_argument("--window", type=int, default=HOURS_WINDOW,
-                        help=f"Hours to look back (default: {HOURS_WINDOW})")
+                        help=f"Hours to look back for a repo without a cursor yet (default: {HOURS_WINDOW})")
     parser.add_argument("--repo", type=str, default=None,
                         help="Only check this repo (e.g. 'AI-Business-Automation-Suite')")
     parser.add_argument("--source", type=str, default="cron",
                         help="Trigger source for logging (cron/push-hook)")
+    parser.add_argument("--replay-since", type=str, default=None,
+                        help="Reprocess commits from this date (ISO, UTC if no offset), ignoring the ledger")
+    parser.add_argument("--replay-until", type=str, default=None,
+                        help="End of the replayed range (default: now)")
+    parser.add_argument("--backend", choices=("api", "git"), default=BACKEND,
+                        help="Read commits from the GitHub API or from local bare mirrors (default: api)")
+    parser.add_argument("--mirror-dir", type=str, default=MIRROR_DIR,
+                        help=f"Where --backend git keeps its mirrors (default: {MIRROR_DIR})")
+    parser.add_argument("--remote", type=str, default=MIRROR_REMOTE,
+                        help="Clone URL template for new mirrors, with {repo} or {name} "
+                             "(e.g. '/srv/git/{name}' to run against local repositories)")
     return parser.parse_args()
 
 
@@ -1146,6 +1553,16 @@ if __name__ == "__main__":
     # Apply CLI overrides
     if args.window != HOURS_WINDOW:
         HOURS_WINDOW = args.window
+    BACKEND, MIRROR_DIR, MIRROR_REMOTE = args.backend, args.mirror_dir, args.remote
+    try:
+        REPLAY_SINCE, REPLAY_UNTIL = (
+            _as_utc(value) if value else None for value in (args.replay_since, args.replay_until))
+    except ValueError as e:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] Invalid replay date: {e}")
+        sys.exit(1)
+    if REPLAY_UNTIL and not REPLAY_SINCE:
+        print(f"[{datetime.now().strftime('%H:%M:%S')}] --replay-until needs --replay-since")
+        sys.exit(1)
 
     if args.repo:
         # Filter repos to only the one specified
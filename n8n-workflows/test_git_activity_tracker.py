@@ -0,0 +1,74 @@
+"""Tests for the git mirror backend of git_activity_tracker.py
+(run with: python -m pytest n8n-workflows)."""
+
+import importlib
+import os
+import subprocess
+
+import pytest
+
+
+def _run_git(repo, *args, date=None):
+    env = {"GIT_AUTHOR_DATE": date, "GIT_COMMITTER_DATE": date} if date else {}
+    subprocess.run(["git", "-c", "user.name=Test", "-c", "user.email=test@example.com", *args],
+                   cwd=repo, check=True, capture_output=True, env={**os.environ, **env})
+
+
+@pytest.fixture
+def tracker(tmp_path, monkeypatch):
+    # The module reads its secrets from ~ at import time
+    home = tmp_path / "home"
+    home.mkdir()
+    for name in (".github-token", ".anthropic-key"):
+        (home / name).write_text("test\n")
+    monkeypatch.setenv("HOME", str(home))
+    module = importlib.import_module("git_activity_tracker")
+    monkeypatch.setattr(module, "MIRROR_DIR", str(tmp_path / "mirrors"))
+    return module
+
+
+@pytest.fixture
+def origin(tmp_path):
+    repo = tmp_path / "origin"
+    repo.mkdir()
+    _run_git(repo, "init", "--quiet", "--initial-branch=main")
+    (repo / "old.txt").write_text("old\n")
+    _run_git(repo, "add", ".")
+    _run_git(repo, "commit", "--quiet", "-m", "Old commit", date="2026-01-01T12:00:00+00:00")
+    (repo / "app.py").write_text("a = 1\nb = 2\nc = 3\n")
+    (repo / "logo.bin").write_bytes(b"\x00\x01\x02")
+    (repo / "old.txt").write_text("new\n")
+    _run_git(repo, "add", ".")
+    _run_git(repo, "commit", "--quiet", "-m", "Add app\n\nWith a body line.", date="2026-03-01T12:00:00+00:00")
+    return repo
+
+
+def test_parse_numstat_counts_lines_and_binary_files(tracker):
+    files = tracker._parse_numstat("3\t1\tapp.py\n-\t-\tlogo.bin\n\nnot a numstat line\n")
+    assert files == [
+        {"filename": "app.py", "additions": 3, "deletions": 1, "changes": 4},
+        {"filename": "logo.bin", "additions": 0, "deletions": 0, "changes": 0},
+    ]
+
+
+def test_fetch_commits_git_reads_local_mirror(tracker, origin, monkeypatch):
+    monkeypatch.setattr(tracker, "MIRROR_REMOTE", str(origin))
+    commits = tracker.fetch_commits_git("owner/origin", "2026-02-01T00:00:00Z")
+
+    assert [c["commit"]["message"] for c in commits] == ["Add app\n\nWith a body line."]
+    commit = commits[0]
+    assert commit["commit"]["author"]["name"] == "Test"
+    assert commit["commit"]["committer"]["date"].startswith("2026-03-01T12:00:00")
+    assert commit["stats"] == {"additions": 4, "deletions": 1, "total": 5}
+    assert sorted(f["filename"] for f in commit["files"]) == ["app.py", "logo.bin", "old.txt"]
+
+
+def test_fetch_commits_git_fetches_into_existing_mirror(tracker, origin, monkeypatch):
+    monkeypatch.setattr(tracker, "MIRROR_REMOTE", str(origin))
+    tracker.fetch_commits_git("owner/origin", "2026-02-01T00:00:00Z")
+    (origin / "app.py").write_text("a = 1\n")
+    _run_git(origin, "commit", "--quiet", "-am", "Trim app", date="2026-04-01T12:00:00+00:00")
+
+    commits = tracker.fetch_commits_git("owner/origin", "2026-02-01T00:00:00Z")
+    assert [c["commit"]["message"].splitlines()[0] for c in commits] == ["Trim app", "Add app"]
+    assert commits[0]["stats"] == {"additions": 0, "deletions": 2, "total": 2}
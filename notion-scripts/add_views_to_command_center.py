@@ -12,6 +12,8 @@ import json
 import sys
 from pathlib import Path
 
+import notion_schema  # shared with reading-system (symlink)
+
 NOTION_API = "https://www.notion.so/api/v3"
 COMMAND_CENTER_ID = "306da200-b2d6-819c-8863-cf78f61ae670"
 
@@ -58,11 +60,7 @@ def get_page_info(headers, page_id):
     return page.get("space_id"), page.get("content", []), blocks
 
 def get_collection_schema(headers, collection_id):
-    data = api_post(headers, "getRecordValues", {
-        "requests": [{"table": "collection", "id": collection_id}]
-    })
-    schema = data["results"][0]["value"]["schema"]
-    return {info["name"]: pid for pid, info in schema.items()}
+    return notion_schema.get_schema(headers, collection_id)
 
 def make_table_format(columns):
     return {"table_properties": [
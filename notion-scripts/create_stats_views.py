@@ -23,6 +23,8 @@ import sys
 import os
 from pathlib import Path
 
+import notion_schema  # shared with reading-system (symlink)
+
 # === CONFIG ===
 NOTION_API = "https://www.notion.so/api/v3"
 STATS_PAGE_ID = "311da200-b2d6-8109-9fa4-ec1f53a93e7d"
@@ -107,20 +109,11 @@ def get_page_info(headers, page_id):
 # === STEP 2: COLLECTION SCHEMAS ===
 
 def get_collection_schema(headers, collection_id):
-    """Get property name -> property ID mapping for a collection"""
-    data = api_post(headers, "getRecordValues", {
-        "requests": [{"table": "collection", "id": collection_id}]
-    })
-
-    result = data["results"][0]
-    if not result.get("value"):
+    """Get property name -> property ID mapping for a collection (via the shared schema cache)"""
+    prop_map = notion_schema.get_schema(headers, collection_id)
+    if not prop_map:
         raise ValueError(f"Collection {collection_id} not found")
 
-    schema = result["value"]["schema"]
-    prop_map = {}
-    for prop_id, prop_info in schema.items():
-        prop_map[prop_info["name"]] = prop_id
-
     return prop_map
 
 
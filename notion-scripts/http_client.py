@@ -0,0 +1 @@
+../reading-system/http_client.py
\ No newline at end of file
@@ -0,0 +1 @@
+../reading-system/notion_schema.py
\ No newline at end of file
@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
-"""Add a book to the Notion Books database via internal API (token_v2)."""
+"""Add a book to the Notion Books database via internal API (token_v2).
 
+    python add_book.py '{"title": "...", "author": "..."}'
+    python add_book.py --bulk goodreads_library_export.csv   # resumable bulk import"""
+
+import argparse
+import csv
 import json
 import os
 import sys
 import uuid
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date
+
+import book_search
+import http_client
+import notion_schema
 from notion_cover_upload import upload_cover
 
 TOKEN = open(os.path.expanduser("~/.notion-token")).read().strip()
@@ -15,44 +25,30 @@ API = "https://www.notion.so/api/v3"
 
 def get_schema():
     """Get Books collection schema to map property names to IDs."""
-    resp = requests.post(f"{API}/syncRecordValues",
-        cookies={"token_v2": TOKEN},
-        headers={"Content-Type": "application/json"},
-        json={"requests": [{"pointer": {"table": "collection", "id": BOOKS_COLLECTION}, "version": -1}]},
-        timeout=15)
-    data = resp.json()
-    collection = data.get("recordMap", {}).get("collection", {}).get(BOOKS_COLLECTION, {}).get("value", {})
-    schema = collection.get("schema", {})
-    return {info.get("name", ""): prop_id for prop_id, info in schema.items()}
+    return notion_schema.get_schema(TOKEN, BOOKS_COLLECTION)
 
 
-def add_book(title, author="", book_format="Physical", lang="EN", total_pages=0, cover_url="", today="", genre=None):
-    """Create a book page in the Books collection."""
+def page_operations(page_id, name_to_id, title, author="", book_format="Physical", lang="EN", total_pages=0,
+                    cover_url="", today="", genre=None, status="Reading", date_started=None, date_finished=None):
+    """submitTransaction operations creating a book page with its properties.
+
+    Date Started is date_started, or today for a book being read; Date Finished is only set when given.
+    Pages Read starts at 0, or at total_pages for a finished book."""
     if not today:
         from datetime import datetime
         today = datetime.now().strftime("%Y-%m-%d")
 
-    page_id = str(uuid.uuid4())
-    name_to_id = get_schema()
+    # Create the page
+    ops = [
+        {"id": page_id, "table": "block", "path": [], "command": "set",
+         "args": {"type": "page", "id": page_id,
+                  "parent_id": BOOKS_COLLECTION, "parent_table": "collection",
+                  "alive": True, "properties": {"title": [[title]]}}},
+        {"table": "collection", "id": BOOKS_COLLECTION,
+         "path": ["pages"], "command": "listAfter", "args": {"id": page_id}},
+    ]
 
-    # Step 1: Create the page
-    requests.post(f"{API}/submitTransaction",
-        cookies={"token_v2": TOKEN},
-        headers={"Content-Type": "application/json"},
-        json={
-            "requestId": str(uuid.uuid4()),
-            "transactions": [{"id": str(uuid.uuid4()), "operations": [
-                {"id": page_id, "table": "block", "path": [], "command": "set",
-                 "args": {"type": "page", "id": page_id,
-                          "parent_id": BOOKS_COLLECTION, "parent_table": "collection",
-                          "alive": True, "properties": {"title": [[title]]}}},
-                {"table": "collection", "id": BOOKS_COLLECTION,
-                 "path": ["pages"], "command": "listAfter", "args": {"id": page_id}},
-            ]}]
-        }, timeout=15)
-
-    # Step 2: Set properties
-    ops = []
+    # Set properties
     ops.append({"pointer": {"table": "block", "id": page_id},
                 "path": ["properties", "title"], "command": "set", "args": [[title]]})
 
@@ -64,9 +60,9 @@ def add_book(title, author="", book_format="Physical", lang="EN", total_pages=0,
         ops.append({"pointer": {"table": "block", "id": page_id},
                     "path": ["properties", name_to_id["Format"]], "command": "set", "args": [[book_format]]})
 
-    if name_to_id.get("Status"):
+    if status and name_to_id.get("Status"):
         ops.append({"pointer": {"table": "block", "id": page_id},
-                    "path": ["properties", name_to_id["Status"]], "command": "set", "args": [["Reading"]]})
+                    "path": ["properties", name_to_id["Status"]], "command": "set", "args": [[status]]})
 
     if name_to_id.get("Language"):
         ops.append({"pointer": {"table": "block", "id": page_id},
@@ -77,8 +73,10 @@ def add_book(title, author="", book_format="Physical", lang="EN", total_pages=0,
                     "path": ["properties", name_to_id["Total Pages"]], "command": "set", "args": [[str(total_pages)]]})
 
     if name_to_id.get("Pages Read"):
+        pages_read = total_pages if status == "Finished" and total_pages else 0
         ops.append({"pointer": {"table": "block", "id": page_id},
-                    "path": ["properties", name_to_id["Pages Read"]], "command": "set", "args": [["0"]]})
+                    "path": ["properties", name_to_id["Pages Read"]], "command": "set",
+                    "args": [[str(pages_read)]]})
 
     if cover_url and name_to_id.get("Cover URL"):
         ops.append({"pointer": {"table": "block", "id": page_id},
@@ -95,20 +93,34 @@ def add_book(title, author="", book_format="Physical", lang="EN", total_pages=0,
         ops.append({"pointer": {"table": "block", "id": page_id},
                     "path": ["properties", name_to_id["Genre"]], "command": "set", "args": genre_args})
 
-    if name_to_id.get("Date Started"):
-        ops.append({"pointer": {"table": "block", "id": page_id},
-                    "path": ["properties", name_to_id["Date Started"]],
-                    "command": "set", "args": [["‣", [["d", {"type": "date", "start_date": today}]]]]})
-
-    if ops:
-        requests.post(f"{API}/submitTransaction",
-            cookies={"token_v2": TOKEN},
-            headers={"Content-Type": "application/json"},
-            json={"requestId": str(uuid.uuid4()),
-                  "transactions": [{"id": str(uuid.uuid4()), "operations": ops}]},
-            timeout=15)
-
-    # Step 3: Upload cover
+    if status == "Reading" and not date_started:
+        date_started = today
+    for prop, day in (("Date Started", date_started), ("Date Finished", date_finished)):
+        if day and name_to_id.get(prop):
+            ops.append({"pointer": {"table": "block", "id": page_id},
+                        "path": ["properties", name_to_id[prop]],
+                        "command": "set", "args": [["‣", [["d", {"type": "date", "start_date": day}]]]]})
+    return ops
+
+
+def submit_transaction(ops):
+    resp = http_client.post(f"{API}/submitTransaction",
+        cookies={"token_v2": TOKEN},
+        headers={"Content-Type": "application/json"},
+        json={"requestId": str(uuid.uuid4()),
+              "transactions": [{"id": str(uuid.uuid4()), "operations": ops}]},
+        timeout=30)
+    resp.raise_for_status()
+
+
+def add_book(title, author="", book_format="Physical", lang="EN", total_pages=0, cover_url="", today="", genre=None,
+             status="Reading"):
+    """Create a book page in the Books collection (one transaction), then upload its cover."""
+    page_id = str(uuid.uuid4())
+    submit_transaction(page_operations(page_id, get_schema(), title, author, book_format, lang, total_pages,
+                                       cover_url, today, genre, status))
+
+    # Upload cover
     cover_ok = False
     if cover_url:
         try:
@@ -120,12 +132,217 @@ def add_book(title, author="", book_format="Physical", lang="EN", total_pages=0,
     return {"page_id": page_id, "cover_uploaded": cover_ok}
 
 
+# --- Bulk import ---
+
+BULK_BATCH = 25          # books per submitTransaction
+RESOLVE_WORKERS = 8      # concurrent metadata lookups (http_client also caps each host)
+COVER_WORKERS = 4
+PAGE_NAMESPACE = uuid.UUID("6f1d9a52-3c0e-4f6b-9f43-2b7c1f0a8e11")
+# Goodreads "Exclusive Shelf" -> Books status; other shelves fall back to --status
+SHELF_STATUS = {"currently-reading": "Reading", "read": "Finished", "to-read": "To Read"}
+
+
+def read_rows(path):
+    """Books to import from a CSV (e.g. a Goodreads export) or JSONL file, as dicts with lowercase keys."""
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.endswith((".jsonl", ".ndjson")):
+            rows = [json.loads(line) for line in f if line.strip()]
+        else:
+            rows = list(csv.DictReader(f))
+    return [{k.strip().lower(): v for k, v in row.items() if k} for row in rows]
+
+
+def row_isbn(row):
+    # Goodreads writes ISBNs as ="9780441172719"
+    for key in ("isbn13", "isbn"):
+        isbn = book_search.isbn13((row.get(key) or "").strip('="'))
+        if isbn:
+            return isbn
+    return None
+
+
+def row_key(row):
+    """Stable identity of an input row: its ISBN-13, else normalized title + author."""
+    isbn = row_isbn(row)
+    if isbn:
+        return f"isbn:{isbn}"
+    return "title:" + book_search.normalize_query(f"{row.get('title', '')} | {row.get('author', '')}")
+
+
+def row_date(row, *keys):
+    """First date found under keys, as YYYY-MM-DD (Goodreads writes 2023/05/14), else None."""
+    for key in keys:
+        value = (row.get(key) or "").strip().replace("/", "-")[:10]
+        try:
+            return date.fromisoformat(value).isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def row_status(row):
+    """The row's own status, else the one its Goodreads shelf maps to, else None."""
+    return row.get("status") or SHELF_STATUS.get((row.get("exclusive shelf") or "").strip().lower())
+
+
+def resolve_metadata(row):
+    """Merge an input row with Google Books / Open Library metadata. Input values win."""
+    query = row_isbn(row) or f"{row.get('title', '')} {row.get('author', '')}".strip()
+    google = book_search.search_google_books(query, max_results=1)
+    g = google[0] if google else {}
+    o = {}
+    if not g.get("cover_url") or not g.get("page_count"):
+        ol = book_search.search_open_library(query, max_results=1)
+        o = ol[0] if ol else {}
+
+    genre = row.get("genre") or g.get("categories") or None
+    pages = row.get("pages") or row.get("number of pages") or g.get("page_count") or o.get("page_count") or 0
+    return {
+        "title": row.get("title") or g.get("title") or o.get("title") or query,
+        "author": row.get("author") or ", ".join(g.get("authors") or o.get("authors") or []),
+        "book_format": row.get("format") or "Physical",
+        "lang": (row.get("lang") or g.get("language") or "EN").upper(),
+        "total_pages": int(pages) if str(pages).isdigit() else 0,
+        "cover_url": row.get("cover_url") or g.get("cover_url") or o.get("cover_url") or "",
+        "genre": genre,
+        "status": row_status(row),
+        "date_started": row_date(row, "date started"),
+        "date_finished": row_date(row, "date finished", "date read"),
+    }
+
+
+def load_state(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {"pages": {}, "covers_pending": {}}
+
+
+def save_state(path, state):
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f, ensure_ascii=False, indent=1)
+    os.replace(tmp, path)
+
+
+def upload_cover_file(page_id, cover_url):
+    return upload_cover(page_id, image_url=cover_url).get("status") == "success"
+
+
+def bulk_import(path, state_path=None, status=None, batch_size=BULK_BATCH,
+                workers=RESOLVE_WORKERS, cover_workers=COVER_WORKERS):
+    """Import every book of a CSV/JSONL file. Returns counts of created, skipped, failed and covers.
+
+    Each book's status comes from its row (status, or Goodreads' Exclusive
+    Shelf); `status` only fills in rows with neither, and None leaves them blank.
+
+    Metadata is resolved concurrently, pages are created BULK_BATCH per
+    transaction and covers uploaded by a worker pool as batches land. Progress
+    is saved to state_path after each batch; page IDs are derived from the row,
+    so re-running after a failure resumes without duplicating pages."""
+    state_path = state_path or f"{path}.import-state.json"
+    state = load_state(state_path)
+    rows = read_rows(path)
+    todo = {}
+    skipped = 0
+    for row in rows:
+        key = row_key(row)
+        if key in state["pages"]:
+            skipped += 1
+        else:
+            todo.setdefault(key, row)  # duplicate rows are imported once
+    total = len(todo)
+    name_to_id = get_schema()
+    counts = {"created": 0, "skipped": skipped, "failed": 0, "covers": 0, "covers_failed": 0}
+    print(f"{len(rows)} livres, {skipped} deja importes, {total} a importer")
+
+    cover_futures = {}
+    with ThreadPoolExecutor(max_workers=workers) as resolver, \
+            ThreadPoolExecutor(max_workers=cover_workers) as covers:
+
+        def queue_cover(page_id, cover_url):
+            cover_futures[covers.submit(upload_cover_file, page_id, cover_url)] = page_id
+
+        for page_id, cover_url in state["covers_pending"].items():
+            queue_cover(page_id, cover_url)
+
+        def commit(batch):
+            ops = [op for _, page_id, book in batch
+                   for op in page_operations(page_id, name_to_id, **{**book, "status": book["status"] or status})]
+            try:
+                submit_transaction(ops)
+            except Exception as e:
+                counts["failed"] += len(batch)
+                print(f"  Lot de {len(batch)} livres echoue (repris au prochain lancement): {e}", file=sys.stderr)
+                return
+            for key, page_id, book in batch:
+                state["pages"][key] = page_id
+                if book["cover_url"]:
+                    state["covers_pending"][page_id] = book["cover_url"]
+                    queue_cover(page_id, book["cover_url"])
+            save_state(state_path, state)
+            counts["created"] += len(batch)
+            print(f"[{counts['created'] + counts['failed']}/{total}] {len(batch)} pages creees")
+
+        futures = {resolver.submit(resolve_metadata, row): key for key, row in todo.items()}
+        batch = []
+        for future in as_completed(futures):
+            key = futures[future]
+            try:
+                book = future.result()
+            except Exception as e:
+                counts["failed"] += 1
+                print(f"  Metadonnees introuvables pour {key}: {e}", file=sys.stderr)
+                continue
+            batch.append((key, str(uuid.uuid5(PAGE_NAMESPACE, key)), book))
+            if len(batch) >= batch_size:
+                commit(batch)
+                batch = []
+        if batch:
+            commit(batch)
+
+        for future in as_completed(list(cover_futures)):
+            page_id = cover_futures[future]
+            try:
+                ok = future.result()
+            except Exception as e:
+                ok = False
+                print(f"  Cover echouee pour {page_id}: {e}", file=sys.stderr)
+            if ok:
+                counts["covers"] += 1
+                state["covers_pending"].pop(page_id, None)
+            else:
+                counts["covers_failed"] += 1
+        save_state(state_path, state)
+    return counts
+
+
+def parse_bulk_args(argv):
+    parser = argparse.ArgumentParser(prog="add_book.py --bulk", description="Import a library (CSV or JSONL)")
+    parser.add_argument("file", help="CSV (Goodreads export works) or JSONL with title/author/isbn per book")
+    parser.add_argument("--state", help="resume file (default: <file>.import-state.json)")
+    parser.add_argument("--status", default=None,
+                        help="Status for rows without one or a Goodreads shelf (default: left empty)")
+    parser.add_argument("--batch", type=int, default=BULK_BATCH, help=f"books per transaction (default: {BULK_BATCH})")
+    parser.add_argument("--workers", type=int, default=RESOLVE_WORKERS, help="concurrent metadata lookups")
+    parser.add_argument("--cover-workers", type=int, default=COVER_WORKERS, help="concurrent cover uploads")
+    return parser.parse_args(argv)
+
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python add_book.py '<json>'")
+        print("       python add_book.py --bulk <books.csv|books.jsonl> [--state FILE] [--status STATUS]")
         print('Example: python add_book.py \'{"title":"Atomic Habits","author":"James Clear","pages":320}\'')
         sys.exit(1)
 
+    if sys.argv[1] == "--bulk":
+        args = parse_bulk_args(sys.argv[2:])
+        counts = bulk_import(args.file, args.state, args.status, args.batch, args.workers, args.cover_workers)
+        print(json.dumps(counts, ensure_ascii=False))
+        sys.exit(1 if counts["failed"] else 0)
+
     data = json.loads(sys.argv[1])
     result = add_book(
         title=data.get("title", ""),
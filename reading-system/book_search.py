@@ -1,96 +1,220 @@
 #!/usr/bin/env python3
 """Book search script using Google Books + Open Library APIs.
-Searches by title/author/ISBN, returns metadata + table of contents when available."""
+Searches by title/author/ISBN, returns metadata + table of contents when available.
+Lookups are cached in a local SQLite file (CACHE_DB), which also serves them offline."""
 
+import os
+import queue
+import re
 import sys
 import json
-import urllib.request
-import urllib.parse
-import urllib.error
+import sqlite3
+import threading
+import time
+import unicodedata
+from concurrent.futures import Future, wait, FIRST_COMPLETED
 
+import http_client
+
+SEARCH_DEADLINE = 6.0   # seconds for a whole concurrent search
+SEARCH_WORKERS = 6      # concurrent lookups per search (http_client also caps each host)
+
+# On-disk cache of search results, volumes (by ISBN-13) and TOCs (by edition key).
+# Entries older than CACHE_TTL are refetched, but still served when the fetch fails.
+# Empty results (no match, or a source having a bad moment) expire after EMPTY_TTL.
+CACHE_DB = os.environ.get("BOOK_CACHE_DB", os.path.expanduser("~/.cache/book-search.db"))
+CACHE_TTL = int(os.environ.get("BOOK_CACHE_TTL", 30 * 86400))
+EMPTY_TTL = int(os.environ.get("BOOK_CACHE_EMPTY_TTL", 3600))
+CACHE_MAX_ENTRIES = int(os.environ.get("BOOK_CACHE_SIZE", 5000))
+
+_conn = None
+_cache_lock = threading.Lock()
+
+
+def normalize_query(query):
+    """Cache key form of a search: lowercase, no accents, single spaces."""
+    text = unicodedata.normalize("NFKD", query)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split())
+
+
+def isbn13(text):
+    """ISBN-13 for an ISBN-10/13 string (dashes and spaces allowed), or None."""
+    digits = re.sub(r"[\s-]", "", text or "").upper()
+    if re.fullmatch(r"\d{13}", digits):
+        return digits
+    if re.fullmatch(r"\d{9}[\dX]", digits):
+        core = "978" + digits[:9]
+        check = (10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(core)) % 10) % 10
+        return core + str(check)
+    return None
+
+
+# --- Cache ---
+
+def _db():
+    global _conn
+    if _conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(CACHE_DB)), exist_ok=True)
+        _conn = sqlite3.connect(CACHE_DB, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.execute("CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                      "fetched_at REAL NOT NULL, used_at REAL NOT NULL)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS entries_used_at ON entries (used_at)")
+    return _conn
+
+
+def cache_get(key, max_age=CACHE_TTL, empty_max_age=EMPTY_TTL):
+    """Cached value for `key` if younger than max_age seconds (empty_max_age for
+    an empty value; None = any age), else None."""
+    with _cache_lock:
+        conn = _db()
+        row = conn.execute("SELECT value, fetched_at FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value = json.loads(row[0])
+        limit = max_age if value else empty_max_age
+        if max_age is not None and limit is not None and time.time() - row[1] > limit:
+            return None
+        with conn:
+            conn.execute("UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), key))
+    return value
+
+
+def cache_put(key, value):
+    """Store a value, evicting the least recently used entries beyond CACHE_MAX_ENTRIES."""
+    now = time.time()
+    with _cache_lock:
+        conn = _db()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO entries (key, value, fetched_at, used_at) VALUES (?, ?, ?, ?)",
+                         (key, json.dumps(value, ensure_ascii=False), now, now))
+            excess = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] - CACHE_MAX_ENTRIES
+            if excess > 0:
+                conn.execute("DELETE FROM entries WHERE key IN "
+                             "(SELECT key FROM entries ORDER BY used_at LIMIT ?)", (excess,))
+
+
+def cached(key, fetch):
+    """Fresh cached value for `key`, else fetch() (stored). When fetch() fails,
+    e.g. offline, a stale entry is served if there is one."""
+    value = cache_get(key)
+    if value is not None:
+        return value
+    try:
+        value = fetch()
+    except Exception:
+        stale = cache_get(key, max_age=None)
+        if stale is None:
+            raise
+        return stale
+    cache_put(key, value)
+    return value
+
+
+# --- Sources ---
 
 def search_google_books(query, max_results=5):
-    """Search Google Books API for book metadata."""
-    params = urllib.parse.urlencode({"q": query, "maxResults": max_results, "langRestrict": ""})
-    url = f"https://www.googleapis.com/books/v1/volumes?{params}"
+    """Search Google Books API for book metadata. Cached by query, and by ISBN-13 per volume."""
+    isbn = isbn13(query)
+    volume = cache_get(f"isbn:google:{isbn}") if isbn else None
+    if volume is not None:
+        return [volume]
+
+    def fetch():
+        params = {"q": query, "maxResults": max_results, "langRestrict": ""}
+        resp = http_client.get("https://www.googleapis.com/books/v1/volumes", params=params, timeout=10)
+        resp.raise_for_status()
+        results = [_google_volume(item) for item in resp.json().get("items", [])]
+        for book in results:
+            if book["isbn_13"]:
+                cache_put(f"isbn:google:{book['isbn_13']}", book)
+        return results
 
     try:
-        req = urllib.request.Request(url, headers={"User-Agent": "ReadingSystem/1.0"})
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
+        return cached(f"google:{max_results}:{normalize_query(query)}", fetch)
     except Exception as e:
         print(f"[Google Books] Erreur: {e}", file=sys.stderr)
         return []
 
-    results = []
-    for item in data.get("items", []):
-        info = item.get("volumeInfo", {})
-        identifiers = {i["type"]: i["identifier"] for i in info.get("industryIdentifiers", [])}
-        results.append({
-            "source": "google",
-            "title": info.get("title", ""),
-            "subtitle": info.get("subtitle", ""),
-            "authors": info.get("authors", []),
-            "publisher": info.get("publisher", ""),
-            "published_date": info.get("publishedDate", ""),
-            "description": info.get("description", ""),
-            "page_count": info.get("pageCount", 0),
-            "categories": info.get("categories", []),
-            "language": info.get("language", ""),
-            "average_rating": info.get("averageRating", None),
-            "isbn_13": identifiers.get("ISBN_13", ""),
-            "isbn_10": identifiers.get("ISBN_10", ""),
-            "cover_url": info.get("imageLinks", {}).get("thumbnail", ""),
-            "preview_link": info.get("previewLink", ""),
-        })
-    return results
+
+def _google_volume(item):
+    info = item.get("volumeInfo", {})
+    identifiers = {i["type"]: i["identifier"] for i in info.get("industryIdentifiers", [])}
+    return {
+        "source": "google",
+        "title": info.get("title", ""),
+        "subtitle": info.get("subtitle", ""),
+        "authors": info.get("authors", []),
+        "publisher": info.get("publisher", ""),
+        "published_date": info.get("publishedDate", ""),
+        "description": info.get("description", ""),
+        "page_count": info.get("pageCount", 0),
+        "categories": info.get("categories", []),
+        "language": info.get("language", ""),
+        "average_rating": info.get("averageRating", None),
+        "isbn_13": identifiers.get("ISBN_13", ""),
+        "isbn_10": identifiers.get("ISBN_10", ""),
+        "cover_url": info.get("imageLinks", {}).get("thumbnail", ""),
+        "preview_link": info.get("previewLink", ""),
+    }
 
 
 def search_open_library(query, max_results=5):
-    """Search Open Library for book metadata + table of contents."""
-    params = urllib.parse.urlencode({"q": query, "limit": max_results, "fields": "key,title,author_name,first_publish_year,isbn,number_of_pages_median,subject,cover_i,edition_key"})
-    url = f"https://openlibrary.org/search.json?{params}"
+    """Search Open Library for book metadata + table of contents. Cached by query, and by ISBN-13 per doc."""
+    isbn = isbn13(query)
+    doc = cache_get(f"isbn:openlibrary:{isbn}") if isbn else None
+    if doc is not None:
+        return [doc]
+
+    def fetch():
+        params = {"q": query, "limit": max_results, "fields": "key,title,author_name,first_publish_year,isbn,number_of_pages_median,subject,cover_i,edition_key"}
+        resp = http_client.get("https://openlibrary.org/search.json", params=params, timeout=10)
+        resp.raise_for_status()
+        results = [_open_library_doc(doc) for doc in resp.json().get("docs", [])[:max_results]]
+        for book in results:
+            if isbn13(book["isbn"]):
+                cache_put(f"isbn:openlibrary:{isbn13(book['isbn'])}", book)
+        return results
 
     try:
-        req = urllib.request.Request(url, headers={"User-Agent": "ReadingSystem/1.0 (contact: prinsechris)"})
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
+        return cached(f"openlibrary:{max_results}:{normalize_query(query)}", fetch)
     except Exception as e:
         print(f"[Open Library] Erreur: {e}", file=sys.stderr)
         return []
 
-    results = []
-    for doc in data.get("docs", [])[:max_results]:
-        cover_id = doc.get("cover_i")
-        cover_url = f"https://covers.openlibrary.org/b/id/{cover_id}-L.jpg" if cover_id else ""
-
-        results.append({
-            "source": "openlibrary",
-            "title": doc.get("title", ""),
-            "authors": doc.get("author_name", []),
-            "first_publish_year": doc.get("first_publish_year", ""),
-            "page_count": doc.get("number_of_pages_median", 0),
-            "subjects": doc.get("subject", [])[:10],
-            "isbn": (doc.get("isbn") or [""])[0],
-            "cover_url": cover_url,
-            "ol_key": doc.get("key", ""),
-            "edition_keys": doc.get("edition_key", [])[:3],
-        })
-    return results
+
+def _open_library_doc(doc):
+    cover_id = doc.get("cover_i")
+    cover_url = f"https://covers.openlibrary.org/b/id/{cover_id}-L.jpg" if cover_id else ""
+    return {
+        "source": "openlibrary",
+        "title": doc.get("title", ""),
+        "authors": doc.get("author_name", []),
+        "first_publish_year": doc.get("first_publish_year", ""),
+        "page_count": doc.get("number_of_pages_median", 0),
+        "subjects": doc.get("subject", [])[:10],
+        "isbn": (doc.get("isbn") or [""])[0],
+        "cover_url": cover_url,
+        "ol_key": doc.get("key", ""),
+        "edition_keys": doc.get("edition_key", [])[:3],
+    }
 
 
 def get_table_of_contents(edition_key):
-    """Fetch table of contents from Open Library edition."""
-    url = f"https://openlibrary.org/books/{edition_key}.json"
+    """Fetch table of contents from Open Library edition. Cached by edition key."""
+    def fetch():
+        resp = http_client.get(f"https://openlibrary.org/books/{edition_key}.json", timeout=10)
+        resp.raise_for_status()
+        return _chapters(resp.json().get("table_of_contents", []))
 
     try:
-        req = urllib.request.Request(url, headers={"User-Agent": "ReadingSystem/1.0 (contact: prinsechris)"})
-        with urllib.request.urlopen(req, timeout=10) as resp:
-            data = json.loads(resp.read().decode())
-    except Exception as e:
+        return cached(f"toc:{edition_key}", fetch)
+    except Exception:
         return []
 
-    toc = data.get("table_of_contents", [])
+
+def _chapters(toc):
     chapters = []
     for entry in toc:
         if isinstance(entry, dict):
@@ -104,6 +228,90 @@ def get_table_of_contents(edition_key):
     return chapters
 
 
+def _start_workers(jobs):
+    """Run (future, fn, args) jobs from the queue on SEARCH_WORKERS daemon
+    threads until they get None. Daemon threads, so a lookup still running
+    past the deadline does not hold up the exit of a CLI call."""
+    def work():
+        while True:
+            job = jobs.get()
+            if job is None:
+                return
+            future, fn, args = job
+            if not future.set_running_or_notify_cancel():
+                continue  # cancelled before it started
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+    for _ in range(SEARCH_WORKERS):
+        threading.Thread(target=work, daemon=True).start()
+
+
+def _submit(jobs, fn, *args):
+    future = Future()
+    jobs.put((future, fn, args))
+    return future
+
+
+def _first_toc(futures, settled=True):
+    """TOC of the first edition, in Open Library order, that has one. Returns
+    (toc, final). With settled=True the answer is only final once every earlier
+    edition has answered; with settled=False editions still running are skipped."""
+    for f in futures:
+        if not f.done():
+            if settled:
+                return [], False
+            continue
+        if f.exception() is None and f.result():
+            return f.result(), True
+    return [], True
+
+
+def search_concurrent(query, max_results=3, deadline=SEARCH_DEADLINE):
+    """Query Google Books, Open Library and the TOC of Open Library editions in parallel.
+
+    TOC lookups for every edition of the first Open Library result start, in
+    order, as soon as Open Library answers; the TOC kept is the first edition's
+    that has one, as a sequential scan would find. Returns (google_results,
+    ol_results, toc) once both sources answered and that TOC is known, or at the
+    deadline with whatever arrived."""
+    end = time.monotonic() + deadline
+    jobs = queue.SimpleQueue()
+    _start_workers(jobs)
+    tocs = []
+    try:
+        google = _submit(jobs, search_google_books, query, max_results)
+        ol = _submit(jobs, search_open_library, query, max_results)
+        pending = {google, ol}
+        google_results, ol_results, toc, final = [], [], [], False
+
+        while pending:
+            done, pending = wait(pending, timeout=max(0, end - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break  # deadline
+            if ol in done:
+                ol_results = ol.result()
+                if ol_results:
+                    tocs = [_submit(jobs, get_table_of_contents, ek) for ek in ol_results[0].get("edition_keys", [])]
+                    pending.update(tocs)
+            if google in done:
+                google_results = google.result()
+            toc, final = _first_toc(tocs)
+            if google.done() and ol.done() and final:
+                break
+        if not final:
+            toc, _ = _first_toc(tocs, settled=False)
+        return google_results, ol_results, toc
+    finally:
+        # Editions not needed any more are never fetched
+        for f in tocs:
+            f.cancel()
+        for _ in range(SEARCH_WORKERS):
+            jobs.put(None)
+
+
 def search_book(query):
     """Combined search: Google Books + Open Library + TOC."""
     print(f"Recherche: '{query}'...\n")
@@ -163,16 +371,7 @@ def search_book(query):
 
 def search_book_json(query):
     """Return search results as JSON (for use by Orun/webhooks)."""
-    google_results = search_google_books(query, max_results=3)
-    ol_results = search_open_library(query, max_results=3)
-
-    # Try to get TOC for first OL result
-    toc = []
-    if ol_results and ol_results[0].get("edition_keys"):
-        for ek in ol_results[0]["edition_keys"]:
-            toc = get_table_of_contents(ek)
-            if toc:
-                break
+    google_results, ol_results, toc = search_concurrent(query, max_results=3)
 
     # Merge best result
     best = {}
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+"""Local SQLite card store — the flashcard server reads from here instead of Notion.
+
+Notion stays the source of truth: a background refresh fills the store, and
+reviews are written here first then flushed to Notion from an outbox table."""
+
+import json
+import os
+import sqlite3
+import threading
+
+from schedulers import LOCAL_STATE_KEYS
+from sm2 import DueIndex
+
+# Outside the script directory, which the server serves as static files
+DB_PATH = os.environ.get("FLASHCARDS_DB", os.path.expanduser("~/.cache/flashcards.db"))
+
+_conn = None
+_lock = threading.RLock()
+_generation = 0
+_due = None
+
+
+def init(path=None):
+    """Open the store (creating tables on first use). Safe to call several times."""
+    global _conn, _due
+    with _lock:
+        if _conn is not None:
+            return _conn
+        path = path or DB_PATH
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        _conn = sqlite3.connect(path, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL")
+        _conn.executescript("""
+            CREATE TABLE IF NOT EXISTS cards (
+                id TEXT PRIMARY KEY,
+                position INTEGER NOT NULL DEFAULT 0,
+                version INTEGER NOT NULL DEFAULT 0,
+                dirty INTEGER NOT NULL DEFAULT 0,
+                next_review TEXT NOT NULL DEFAULT '',
+                data TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS pending_reviews (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                card_id TEXT NOT NULL,
+                payload TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS failed_reviews (
+                seq INTEGER PRIMARY KEY,
+                card_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                error TEXT NOT NULL,
+                failed_at TEXT NOT NULL DEFAULT (datetime('now'))
+            );
+            CREATE TABLE IF NOT EXISTS review_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                card_id TEXT NOT NULL,
+                reviewed_on TEXT NOT NULL,
+                quality INTEGER NOT NULL,
+                review_id TEXT
+            );
+        """)
+        columns = [row[1] for row in _conn.execute("PRAGMA table_info(cards)")]
+        if "next_review" not in columns:
+            # Stores created before the due index: add the column and backfill it
+            _conn.execute("ALTER TABLE cards ADD COLUMN next_review TEXT NOT NULL DEFAULT ''")
+            _conn.execute("UPDATE cards SET next_review = COALESCE(json_extract(data, '$.next_review'), '')")
+        _conn.execute("CREATE INDEX IF NOT EXISTS cards_next_review ON cards (next_review)")
+        if "review_id" not in [row[1] for row in _conn.execute("PRAGMA table_info(review_log)")]:
+            _conn.execute("ALTER TABLE review_log ADD COLUMN review_id TEXT")
+        # A client retrying a batch the server already applied must not review the cards twice
+        _conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS review_log_review_id ON review_log (review_id)")
+        _conn.commit()
+        _due = DueIndex(_conn.execute("SELECT id, next_review FROM cards ORDER BY next_review, position"))
+        return _conn
+
+
+def generation():
+    """Counter bumped on every change to the stored cards, for callers caching derived data."""
+    return _generation
+
+
+def is_empty():
+    with _lock:
+        return init().execute("SELECT 1 FROM cards LIMIT 1").fetchone() is None
+
+
+def all_cards():
+    """Return every stored card, in Notion view order."""
+    with _lock:
+        rows = init().execute("SELECT data FROM cards ORDER BY position").fetchall()
+    return [json.loads(data) for (data,) in rows]
+
+
+def get_card(card_id):
+    with _lock:
+        row = init().execute("SELECT data FROM cards WHERE id = ?", (card_id,)).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def _cards_by_id(conn, card_ids):
+    """Card dicts for the given IDs, in the same order."""
+    found = {}
+    for i in range(0, len(card_ids), 500):
+        chunk = card_ids[i:i + 500]
+        rows = conn.execute(f"SELECT id, data FROM cards WHERE id IN ({','.join('?' * len(chunk))})", chunk)
+        found.update(rows)
+    return [json.loads(found[cid]) for cid in card_ids if cid in found]
+
+
+def due_cards(day):
+    """Cards due on `day` (ISO date) or earlier, looked up through the due index."""
+    conn = init()
+    with _lock:
+        return _cards_by_id(conn, _due.due(day))
+
+
+def count_due(day):
+    init()
+    with _lock:
+        return _due.count_due(day)
+
+
+def upcoming(after, until):
+    """[(date, count)] of reviews scheduled in (after, until]."""
+    init()
+    with _lock:
+        return _due.upcoming(after, until)
+
+
+def versions():
+    """Map card ID -> last synced Notion record version."""
+    with _lock:
+        return dict(init().execute("SELECT id, version FROM cards").fetchall())
+
+
+def sync(block_ids, changed_cards):
+    """Apply a Notion snapshot.
+
+    block_ids is the full, ordered list of cards in the collection; changed_cards
+    only holds the cards whose record version moved. Cards with unflushed local
+    reviews are left untouched, and cards gone from Notion are dropped.
+    Scheduler state that only lives here (LOCAL_STATE_KEYS) is carried over.
+    Returns the number of rows written, moved or deleted."""
+    global _generation
+    changed = {c["id"]: c for c in changed_cards}
+    conn = init()
+    with _lock, conn:
+        stored, positions = {}, {}
+        for cid, dirty, position in conn.execute("SELECT id, dirty, position FROM cards"):
+            stored[cid], positions[cid] = dirty, position
+        local_state = {card["id"]: card for card in _cards_by_id(conn, [cid for cid in changed if cid in stored])}
+        written = moved = 0
+        for position, block_id in enumerate(block_ids):
+            card = changed.get(block_id)
+            if card is not None and not stored.get(block_id):
+                previous = local_state.get(block_id, {})
+                card = {**card, **{k: previous[k] for k in LOCAL_STATE_KEYS if k in previous}}
+                conn.execute(
+                    "INSERT INTO cards (id, position, version, dirty, next_review, data) VALUES (?, ?, ?, 0, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET position = excluded.position, version = excluded.version, "
+                    "next_review = excluded.next_review, data = excluded.data",
+                    (block_id, position, card.get("version", 0), card.get("next_review", ""),
+                     json.dumps(card, ensure_ascii=False)))
+                _due.set(block_id, card.get("next_review", ""))
+                written += 1
+            elif block_id in stored and positions[block_id] != position:
+                # A reorder in Notion changes the order /api/cards serves
+                conn.execute("UPDATE cards SET position = ? WHERE id = ?", (position, block_id))
+                moved += 1
+        live = set(block_ids)
+        gone = [cid for cid, dirty in stored.items() if cid not in live and not dirty]
+        for cid in gone:
+            conn.execute("DELETE FROM cards WHERE id = ?", (cid,))
+            _due.remove(cid)
+        if written or moved or gone:
+            _generation += 1
+        return written + moved + len(gone)
+
+
+def apply_review(card_id, quality, schedule, review_id=None):
+    """Review one card locally and queue it for Notion. Returns the updated card, or None."""
+    return apply_reviews([(card_id, quality, review_id)], schedule)[0]
+
+
+def apply_reviews(reviews, schedule):
+    """Apply (card_id, quality, review_id) reviews in one pass and one transaction.
+
+    schedule(card, quality) computes the fields to write from the stored card
+    state; a card reviewed twice in the same batch sees its first review.
+    A review_id already logged is a client retry: the card is returned as
+    stored, not reviewed again. review_id may be None (no deduplication).
+    Returns the updated cards, with None for unknown IDs."""
+    global _generation
+    conn = init()
+    updated = []
+    changed = False
+    with _lock, conn:
+        for card_id, quality, review_id in reviews:
+            row = conn.execute("SELECT data FROM cards WHERE id = ?", (card_id,)).fetchone()
+            if row is None:
+                updated.append(None)
+                continue
+            card = json.loads(row[0])
+            fields = schedule(card, quality)
+            logged = conn.execute(
+                "INSERT OR IGNORE INTO review_log (card_id, reviewed_on, quality, review_id) VALUES (?, ?, ?, ?)",
+                (card_id, fields.get("last_reviewed", ""), quality, review_id))
+            if not logged.rowcount:
+                updated.append(card)
+                continue
+            card.update(fields)
+            conn.execute("UPDATE cards SET data = ?, next_review = ?, dirty = 1 WHERE id = ?",
+                         (json.dumps(card, ensure_ascii=False), card.get("next_review", ""), card_id))
+            _due.set(card_id, card.get("next_review", ""))
+            conn.execute("INSERT INTO pending_reviews (card_id, payload) VALUES (?, ?)",
+                         (card_id, json.dumps(fields, ensure_ascii=False)))
+            updated.append(card)
+            changed = True
+        if changed:
+            _generation += 1
+    return updated
+
+
+def review_history():
+    """Every logged review as (card_id, reviewed_on, quality), oldest first. Used to fit schedulers."""
+    with _lock:
+        return init().execute("SELECT card_id, reviewed_on, quality FROM review_log ORDER BY seq").fetchall()
+
+
+def pending_reviews(limit=100):
+    """Oldest unflushed reviews as (seq, card_id, fields) tuples."""
+    with _lock:
+        rows = init().execute(
+            "SELECT seq, card_id, payload FROM pending_reviews ORDER BY seq LIMIT ?", (limit,)).fetchall()
+    return [(seq, card_id, json.loads(payload)) for seq, card_id, payload in rows]
+
+
+def mark_flushed(seqs):
+    """Drop flushed reviews and clear the dirty flag of cards with nothing left to send."""
+    if not seqs:
+        return
+    conn = init()
+    with _lock, conn:
+        conn.executemany("DELETE FROM pending_reviews WHERE seq = ?", [(s,) for s in seqs])
+        conn.execute("UPDATE cards SET dirty = 0 WHERE dirty = 1 AND id NOT IN "
+                     "(SELECT card_id FROM pending_reviews)")
+
+
+def dead_letter(seq, error):
+    """Move a review Notion keeps rejecting out of the outbox, into failed_reviews."""
+    conn = init()
+    with _lock, conn:
+        conn.execute("INSERT OR REPLACE INTO failed_reviews (seq, card_id, payload, error) "
+                     "SELECT seq, card_id, payload, ? FROM pending_reviews WHERE seq = ?", (error, seq))
+    mark_flushed([seq])
+
+
+def failed_reviews():
+    """Dead-lettered reviews as (seq, card_id, fields, error, failed_at), oldest first."""
+    with _lock:
+        rows = init().execute(
+            "SELECT seq, card_id, payload, error, failed_at FROM failed_reviews ORDER BY seq").fetchall()
+    return [(seq, card_id, json.loads(payload), error, at) for seq, card_id, payload, error, at in rows]
+
+
+def requeue_failed():
+    """Send dead-lettered reviews again, once the cause (e.g. a bad token) is fixed.
+
+    A stale payload could undo later reviews in Notion, so each card gets one
+    outbox entry carrying its current values for the failed fields.
+    Returns the number of cards requeued."""
+    conn = init()
+    with _lock, conn:
+        fields = {}
+        for card_id, payload in conn.execute("SELECT card_id, payload FROM failed_reviews ORDER BY seq"):
+            fields.setdefault(card_id, set()).update(json.loads(payload))
+        cards = {card["id"]: card for card in _cards_by_id(conn, list(fields))}
+        for card_id, card in cards.items():
+            conn.execute("INSERT INTO pending_reviews (card_id, payload) VALUES (?, ?)",
+                         (card_id, json.dumps({k: card[k] for k in fields[card_id] if k in card},
+                                              ensure_ascii=False)))
+            conn.execute("UPDATE cards SET dirty = 1 WHERE id = ?", (card_id,))
+            conn.execute("DELETE FROM failed_reviews WHERE card_id = ?", (card_id,))
+        return len(cards)
@@ -1,13 +1,29 @@
 #!/usr/bin/env python3
 """Serveur local pour l'interface Flashcards — sert l'HTML et fait le pont avec Notion."""
 
+import gzip
+import hashlib
 import json
 import os
+import re
+import sys
+import threading
+import time
 import uuid
-from http.server import HTTPServer, SimpleHTTPRequestHandler
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
 from datetime import datetime, timedelta
+from urllib.parse import parse_qs, urlsplit
 import requests
 
+import card_store
+import http_client
+import grading_cache
+import notion_schema
+from schedulers import get_scheduler
+
 _token_path = os.environ.get("NOTION_TOKEN_FILE", os.path.expanduser("~/.notion-token"))
 TOKEN = open(_token_path).read().strip()
 _anthropic_path = os.environ.get("ANTHROPIC_KEY_FILE", os.path.expanduser("~/.anthropic-key"))
@@ -16,6 +32,46 @@ API = "https://www.notion.so/api/v3"
 FLASHCARDS_COLLECTION = "e5467f7c-81c2-4a6e-8c61-aa4bb3ee841c"
 FLASHCARDS_DB_PAGE = "08822a47-99fd-47ee-9f13-2ecc6043e63b"
 PORT = 8765
+PAGE_SIZE = 200
+BLOCK_CHUNK = 100
+FETCH_WORKERS = 4
+SCHEDULER = get_scheduler(os.environ.get("FLASHCARDS_SCHEDULER", "sm2"))
+REFRESH_SECONDS = int(os.environ.get("FLASHCARDS_REFRESH_SECONDS", 300))
+FLUSH_SECONDS = 30
+REVIEW_COALESCE_SECONDS = 2
+REVIEWS_PER_TRANSACTION = 50
+WORKERS = int(os.environ.get("FLASHCARDS_WORKERS", 16))
+
+# Local grading tier: short answers are judged against the card's back; typos in
+# long words are accepted, answers below the reject threshold are wrong, and
+# everything in between goes to Haiku.
+REJECT_SIMILARITY = float(os.environ.get("GRADER_REJECT", 0.25))
+LOCAL_MAX_TOKENS = 6     # longer answers need the model (paraphrases, explanations)
+SHORT_TOKEN = 3          # a word this short (XIV/XV, pas, USA) always sends the answer to the model
+TYPO_MIN_LENGTH = 8      # only words this long are forgiven a typo (amylase/amylose are not typos)
+CHECK_BATCH_MAX = 40     # answers graded per model call by /api/check/batch
+_json_decoder = json.JSONDecoder()
+
+# Max in-flight requests per route, so slow AI grading can't starve card fetches.
+# A request that can't get a slot within ROUTE_WAIT_SECONDS gets a 503.
+ROUTE_LIMITS = {
+    "/api/check": 4,
+    "/api/check/stats": 8,
+    "/api/check/batch": 2,
+    "/api/review": 8,
+    "/api/review/batch": 4,
+    "/api/cards": 8,
+    "/api/due": 8,
+    "/api/upcoming": 8,
+}
+ROUTE_WAIT_SECONDS = 1.0
+_route_slots = {route: threading.BoundedSemaphore(n) for route, n in ROUTE_LIMITS.items()}
+
+_flush_wakeup = threading.Event()
+
+# Serialized + gzipped bodies of /api/cards and /api/due: route -> (key, etag, raw, gzipped)
+_bodies = {}
+_bodies_lock = threading.Lock()
 
 _view_id_cache = None
 
@@ -24,7 +80,7 @@ def get_view_id():
     global _view_id_cache
     if _view_id_cache:
         return _view_id_cache
-    resp = requests.post(f"{API}/syncRecordValues",
+    resp = http_client.post(f"{API}/syncRecordValues",
         cookies={"token_v2": TOKEN},
         headers={"Content-Type": "application/json"},
         json={"requests": [{"pointer": {"table": "block", "id": FLASHCARDS_DB_PAGE}, "version": -1}]},
@@ -37,137 +93,185 @@ def get_view_id():
 
 
 def get_schema():
-    """Get Flashcards collection schema."""
-    resp = requests.post(f"{API}/syncRecordValues",
-        cookies={"token_v2": TOKEN},
-        headers={"Content-Type": "application/json"},
-        json={"requests": [{"pointer": {"table": "collection", "id": FLASHCARDS_COLLECTION}, "version": -1}]},
-        timeout=15)
-    data = resp.json()
-    coll = data.get("recordMap", {}).get("collection", {}).get(FLASHCARDS_COLLECTION, {}).get("value", {})
-    schema = coll.get("schema", {})
-    return {info.get("name", ""): pid for pid, info in schema.items()}
+    """Get Flashcards collection schema (cached, see notion_schema)."""
+    return notion_schema.get_schema(TOKEN, FLASHCARDS_COLLECTION)
 
 
-def query_flashcards():
-    """Get all flashcards from Notion."""
-    view_id = get_view_id()
-    resp = requests.post(f"{API}/queryCollection",
-        cookies={"token_v2": TOKEN},
-        headers={"Content-Type": "application/json"},
-        json={
-            "collection": {"id": FLASHCARDS_COLLECTION},
-            "collectionView": {"id": view_id},
-            "loader": {
-                "type": "reducer",
-                "reducers": {
-                    "results": {
-                        "type": "results",
-                        "limit": 200,
-                    }
-                },
-                "searchQuery": "",
-                "userTimeZone": "Europe/Paris",
-            }
-        },
-        timeout=15)
-    data = resp.json()
+def iter_flashcard_ids(page_size=PAGE_SIZE, listing=None):
+    """Yield card block IDs in view order, one page at a time.
 
-    name_to_id = get_schema()
-    id_to_name = {v: k for k, v in name_to_id.items()}
-
-    result_ids = data.get("result", {}).get("reducerResults", {}).get("results", {}).get("blockIds", [])
-
-    # Fetch full data for each card via syncRecordValues
-    if result_ids:
-        reqs = [{"pointer": {"table": "block", "id": rid}, "version": -1} for rid in result_ids]
-        sync_resp = requests.post(f"{API}/syncRecordValues",
+    queryCollection has no offset parameter, so each page re-runs the query with
+    a doubled limit and the count of IDs already yielded acts as the cursor.
+    A card added or moved mid-walk can slip behind that cursor, so the IDs
+    yielded are not a reliable list of the collection; the last query's
+    complete ordered list is stored in `listing` instead."""
+    view_id = get_view_id()
+    cursor = 0
+    limit = page_size
+    while True:
+        resp = http_client.post(f"{API}/queryCollection",
             cookies={"token_v2": TOKEN},
             headers={"Content-Type": "application/json"},
-            json={"requests": reqs},
+            json={
+                "collection": {"id": FLASHCARDS_COLLECTION},
+                "collectionView": {"id": view_id},
+                "loader": {
+                    "type": "reducer",
+                    "reducers": {
+                        "results": {
+                            "type": "results",
+                            "limit": limit,
+                        }
+                    },
+                    "searchQuery": "",
+                    "userTimeZone": "Europe/Paris",
+                }
+            },
             timeout=15)
-        blocks = sync_resp.json().get("recordMap", {}).get("block", {})
-    else:
-        blocks = {}
-
-    cards = []
-
-    for block_id in result_ids:
-        block_data = blocks.get(block_id, {})
-        value = block_data.get("value", {})
-        if not value.get("alive", True):
-            continue
+        data = resp.json()
+        coll = data.get("recordMap", {}).get("collection", {}).get(FLASHCARDS_COLLECTION, {}).get("value", {})
+        notion_schema.observe_version(FLASHCARDS_COLLECTION, coll.get("version"))
+        results = data.get("result", {}).get("reducerResults", {}).get("results", {})
+        block_ids = results.get("blockIds", [])
+        yield from block_ids[cursor:]
+        cursor = max(cursor, len(block_ids))
+        if not results.get("hasMore", len(block_ids) >= limit):
+            if listing is not None:
+                listing[:] = block_ids
+            return
+        limit *= 2
 
-        props = value.get("properties", {})
 
-        # Parse properties
-        def get_text(prop_id):
-            val = props.get(prop_id, [[""]])
-            if val and val[0]:
-                return val[0][0] if isinstance(val[0], list) else str(val[0])
+def fetch_blocks(block_ids, known):
+    """Fetch one chunk of blocks, sending known versions so unchanged ones can be skipped."""
+    reqs = [{"pointer": {"table": "block", "id": rid}, "version": known.get(rid, -1)} for rid in block_ids]
+    resp = http_client.post(f"{API}/syncRecordValues",
+        cookies={"token_v2": TOKEN},
+        headers={"Content-Type": "application/json"},
+        json={"requests": reqs},
+        timeout=15)
+    return resp.json().get("recordMap", {}).get("block", {})
+
+
+def _chunks(iterable, size):
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def parse_card(block_id, value, name_to_id):
+    """Turn a Flashcards block into the card dict served by the API. Returns None if it has no front."""
+    props = value.get("properties", {})
+
+    # Parse properties
+    def get_text(prop_id):
+        val = props.get(prop_id, [[""]])
+        if val and val[0]:
+            return val[0][0] if isinstance(val[0], list) else str(val[0])
+        return ""
+
+    def get_number(prop_id):
+        val = get_text(prop_id)
+        try:
+            return float(val) if val else 0
+        except (ValueError, TypeError):
+            return 0
+
+    def get_date(prop_id):
+        val = props.get(prop_id)
+        if not val:
             return ""
+        # Notion date format: [["‣", [["d", {"type": "date", "start_date": "2026-03-16"}]]]]
+        try:
+            for item in val:
+                if isinstance(item, list):
+                    for sub in item:
+                        if isinstance(sub, list) and len(sub) >= 2 and sub[0] == "d":
+                            return sub[1].get("start_date", "")
+        except (TypeError, IndexError, KeyError):
+            pass
+        return ""
+
+    front = get_text("title")
+    if not front:
+        return None
+
+    return {
+        "id": block_id,
+        "front": front,
+        "back": get_text(name_to_id.get("Back", "")),
+        "type": get_text(name_to_id.get("Type", "")) or "Factual",
+        "difficulty": get_text(name_to_id.get("Difficulty", "")) or "3",
+        "chapter": get_text(name_to_id.get("Chapter", "")),
+        "status": get_text(name_to_id.get("Status", "")) or "New",
+        "quality": get_number(name_to_id.get("Quality", "")),
+        "repetitions": int(get_number(name_to_id.get("Repetitions", ""))),
+        "ease_factor": get_number(name_to_id.get("Ease Factor", "")) or 2.5,
+        "interval_days": int(get_number(name_to_id.get("Interval Days", ""))),
+        "next_review": get_date(name_to_id.get("Next Review", "")),
+        "last_reviewed": get_date(name_to_id.get("Last Reviewed", "")),
+        "version": value.get("version", 0),
+    }
+
+
+def iter_flashcards(known=None, listing=None):
+    """Stream the Flashcards collection as (block_id, card) pairs in view order.
+
+    card is None when the block is unchanged since `known` (ID -> version) or
+    is not a valid card; deleted blocks are not yielded at all. Blocks are
+    fetched in BLOCK_CHUNK-sized requests, FETCH_WORKERS chunks in flight.
+    `listing` receives the full ordered ID list (see iter_flashcard_ids)."""
+    known = known or {}
+    name_to_id = get_schema()
+    with ThreadPoolExecutor(max_workers=FETCH_WORKERS, thread_name_prefix="notion") as pool:
+        in_flight = deque()
+        ids = _chunks(iter_flashcard_ids(listing=listing), BLOCK_CHUNK)
+        while True:
+            for chunk in ids:
+                in_flight.append((chunk, pool.submit(fetch_blocks, chunk, known)))
+                if len(in_flight) >= FETCH_WORKERS:
+                    break
+            if not in_flight:
+                return
+            chunk, future = in_flight.popleft()
+            blocks = future.result()
+            for block_id in chunk:
+                value = blocks.get(block_id, {}).get("value", {})
+                if not value:
+                    if block_id in known:
+                        yield block_id, None  # unchanged since last sync
+                    continue
+                if not value.get("alive", True):
+                    continue
+                if known.get(block_id) == value.get("version", 0):
+                    yield block_id, None
+                    continue
+                yield block_id, parse_card(block_id, value, name_to_id)
 
-        def get_number(prop_id):
-            val = get_text(prop_id)
-            try:
-                return float(val) if val else 0
-            except (ValueError, TypeError):
-                return 0
-
-        def get_date(prop_id):
-            val = props.get(prop_id)
-            if not val:
-                return ""
-            # Notion date format: [["‣", [["d", {"type": "date", "start_date": "2026-03-16"}]]]]
-            try:
-                for item in val:
-                    if isinstance(item, list):
-                        for sub in item:
-                            if isinstance(sub, list) and len(sub) >= 2 and sub[0] == "d":
-                                return sub[1].get("start_date", "")
-            except (TypeError, IndexError, KeyError):
-                pass
-            return ""
 
-        front = get_text("title")
-        back = get_text(name_to_id.get("Back", ""))
-        card_type = get_text(name_to_id.get("Type", ""))
-        difficulty = get_text(name_to_id.get("Difficulty", ""))
-        chapter = get_text(name_to_id.get("Chapter", ""))
-        status = get_text(name_to_id.get("Status", ""))
-        quality = get_number(name_to_id.get("Quality", ""))
-        repetitions = get_number(name_to_id.get("Repetitions", ""))
-        ease_factor = get_number(name_to_id.get("Ease Factor", ""))
-        interval_days = get_number(name_to_id.get("Interval Days", ""))
-        next_review = get_date(name_to_id.get("Next Review", ""))
-        last_reviewed = get_date(name_to_id.get("Last Reviewed", ""))
-
-        if not front:
-            continue
+def query_flashcards():
+    """Sync flashcards from Notion into the local store and return them.
 
-        cards.append({
-            "id": block_id,
-            "front": front,
-            "back": back,
-            "type": card_type or "Factual",
-            "difficulty": difficulty or "3",
-            "chapter": chapter,
-            "status": status or "New",
-            "quality": quality,
-            "repetitions": int(repetitions),
-            "ease_factor": ease_factor or 2.5,
-            "interval_days": int(interval_days),
-            "next_review": next_review,
-            "last_reviewed": last_reviewed,
-        })
+    Only blocks whose record version moved since the last sync are parsed and
+    written back to the store. Order and deletions follow the last query's
+    complete list, never the IDs gathered across pages."""
+    listing = []
+    changed = [card for _, card in iter_flashcards(card_store.versions(), listing) if card]
+    card_store.sync(listing, changed)
+    return card_store.all_cards()
 
-    return cards
 
+def review_operations(name_to_id, card_id, quality, repetitions, ease_factor, interval_days, next_review,
+                      status, last_reviewed=None, **scheduler_state):
+    """Build the submitTransaction operations that write one review to a card.
 
-def update_flashcard(card_id, quality, repetitions, ease_factor, interval_days, next_review, status):
-    """Update a flashcard in Notion after review."""
-    name_to_id = get_schema()
-    today = datetime.now().strftime("%Y-%m-%d")
+    Scheduler-specific state (e.g. FSRS stability) only lives in the local store."""
+    today = last_reviewed or datetime.now().strftime("%Y-%m-%d")
 
     ops = []
     if name_to_id.get("Quality"):
@@ -198,20 +302,204 @@ def update_flashcard(card_id, quality, repetitions, ease_factor, interval_days,
         ops.append({"pointer": {"table": "block", "id": card_id},
                     "path": ["properties", name_to_id["Next Review"]], "command": "set",
                     "args": [["‣", [["d", {"type": "date", "start_date": next_review}]]]]})
+    return ops
 
-    if ops:
-        requests.post(f"{API}/submitTransaction",
-            cookies={"token_v2": TOKEN},
-            headers={"Content-Type": "application/json"},
-            json={"requestId": str(uuid.uuid4()),
-                  "transactions": [{"id": str(uuid.uuid4()), "operations": ops}]},
-            timeout=15)
+
+def submit_operations(ops):
+    """Send operations to Notion as a single transaction."""
+    if not ops:
+        return
+    resp = http_client.post(f"{API}/submitTransaction",
+        cookies={"token_v2": TOKEN},
+        headers={"Content-Type": "application/json"},
+        json={"requestId": str(uuid.uuid4()),
+              "transactions": [{"id": str(uuid.uuid4()), "operations": ops}]},
+        timeout=15)
+    resp.raise_for_status()
+
+
+def update_flashcard(card_id, quality, repetitions, ease_factor, interval_days, next_review, status,
+                     last_reviewed=None):
+    """Update a flashcard in Notion after review."""
+    submit_operations(review_operations(get_schema(), card_id, quality, repetitions, ease_factor,
+                                        interval_days, next_review, status, last_reviewed))
+
+
+def update_flashcards(reviews):
+    """Write several (card_id, fields) reviews to Notion in one transaction."""
+    name_to_id = get_schema()
+    ops = []
+    for card_id, fields in reviews:
+        ops.extend(review_operations(name_to_id, card_id, **fields))
+    submit_operations(ops)
+
+
+def schedule_review(card, quality):
+    """Compute the next state of a card from its stored state, with the configured scheduler."""
+    result = SCHEDULER.review(card, quality)
+    result["quality"] = quality
+    result["last_reviewed"] = datetime.now().strftime("%Y-%m-%d")
+    return result
+
+
+def with_preview(cards):
+    """Attach the interval and status each rating (0-5) would give, so the UI needs no scheduler."""
+    for card in cards:
+        card["preview"] = [{"interval_days": r["interval_days"], "status": r["status"]}
+                           for r in (SCHEDULER.review(card, q) for q in range(6))]
+    return cards
+
+
+def parse_quality(value):
+    """Validate a 0-5 quality rating from the client. Returns None if unusable."""
+    try:
+        return max(0, min(5, int(value)))
+    except (TypeError, ValueError):
+        return None
+
+
+def parse_review_id(value):
+    """Client-generated review ID (any short string), or None if absent or unusable."""
+    return value if isinstance(value, str) and 0 < len(value) <= 64 else None
+
+
+def parse_reviews(body):
+    """Validate a /api/review/batch body: {"reviews": [{"id": str, "quality": 0-5,
+    "review_id": str (optional)}, ...]}.
+    Returns [(card_id, quality, review_id)], or None if anything is malformed."""
+    reviews = body.get("reviews") if isinstance(body, dict) else None
+    if not isinstance(reviews, list):
+        return None
+    parsed = []
+    for r in reviews:
+        if not isinstance(r, dict) or not isinstance(r.get("id"), str) or not r["id"]:
+            return None
+        quality = parse_quality(r.get("quality"))
+        if quality is None:
+            return None
+        parsed.append((r["id"], quality, parse_review_id(r.get("review_id"))))
+    return parsed
+
+
+def get_cards():
+    """Cards from the local store; only the very first call waits on Notion."""
+    if card_store.is_empty():
+        return query_flashcards()
+    return card_store.all_cards()
+
+
+def due_cards(day):
+    """Cards due on `day` or earlier, from the store's due index."""
+    if card_store.is_empty():
+        query_flashcards()
+    return card_store.due_cards(day)
+
+
+def cached_body(route, key, build):
+    """(etag, raw, gzipped) JSON body for `route`, rebuilt by build() only when `key` changes.
+
+    The ETag is a hash of the content, so it survives restarts and refreshes that change nothing."""
+    with _bodies_lock:
+        entry = _bodies.get(route)
+        if entry and entry[0] == key:
+            return entry[1:]
+    raw = json.dumps(build(), ensure_ascii=False).encode()
+    entry = (key, f'"{hashlib.sha1(raw).hexdigest()[:20]}"', raw, gzip.compress(raw, 6))
+    with _bodies_lock:
+        _bodies[route] = entry
+    return entry[1:]
+
+
+def upcoming_workload(days):
+    """Due-now count plus the number of reviews scheduled on each of the next `days` days."""
+    today = datetime.now().date()
+    until = (today + timedelta(days=days)).isoformat()
+    return {
+        "due_now": card_store.count_due(today.isoformat()),
+        "days": [{"date": d, "count": n} for d, n in card_store.upcoming(today.isoformat(), until)],
+    }
+
+
+def is_permanent(error):
+    """True for flush failures a retry cannot fix: Notion rejected the request
+    (4xx other than 408/409/429, e.g. a card deleted in Notion) or the review is malformed.
+    401/403 are not: an expired token_v2 rejects every review until it is renewed."""
+    if isinstance(error, requests.HTTPError) and error.response is not None:
+        code = error.response.status_code
+        return 400 <= code < 500 and code not in (401, 403, 408, 409, 429)
+    return isinstance(error, (ValueError, TypeError, KeyError))
+
+
+def flush_batch(pending):
+    """Send one batch of (seq, card_id, fields) reviews. Returns (reviews retired, keep going).
+
+    A transient failure stops the flush so reviews keep their order. A
+    permanent one is bisected down to the offending reviews, which are moved
+    to the store's failed_reviews table instead of blocking the outbox."""
+    try:
+        update_flashcards([(card_id, fields) for _, card_id, fields in pending])
+    except Exception as e:
+        if not is_permanent(e):
+            print(f"Flush error ({len(pending)} reviews), retrying later: {e}", file=sys.stderr)
+            return 0, False
+        if len(pending) == 1:
+            seq, card_id, _ = pending[0]
+            print(f"Review {seq} of card {card_id} rejected, moved to failed_reviews: {e}", file=sys.stderr)
+            card_store.dead_letter(seq, str(e))
+            return 1, True
+        half = len(pending) // 2
+        retired, ok = flush_batch(pending[:half])
+        if not ok:
+            return retired, False
+        more, ok = flush_batch(pending[half:])
+        return retired + more, ok
+    card_store.mark_flushed([seq for seq, _, _ in pending])
+    return len(pending), True
+
+
+def flush_reviews():
+    """Push queued reviews to Notion, REVIEWS_PER_TRANSACTION at a time (see flush_batch)."""
+    flushed = 0
+    while True:
+        pending = card_store.pending_reviews(limit=REVIEWS_PER_TRANSACTION)
+        if not pending:
+            return flushed
+        retired, ok = flush_batch(pending)
+        flushed += retired
+        if not ok:
+            return flushed
+
+
+def refresh_loop():
+    """Keep the store in sync with Notion in the background."""
+    while True:
+        try:
+            query_flashcards()
+        except Exception as e:
+            print(f"Refresh error: {e}", file=sys.stderr)
+        time.sleep(REFRESH_SECONDS)
+
+
+def flush_loop():
+    """Flush reviews as soon as they arrive, and retry leftovers periodically."""
+    while True:
+        if _flush_wakeup.wait(FLUSH_SECONDS):
+            # Let the rest of a burst arrive so it lands in the same transaction
+            time.sleep(REVIEW_COALESCE_SECONDS)
+        _flush_wakeup.clear()
+        flush_reviews()
+
+
+def start_sync():
+    card_store.init()
+    threading.Thread(target=refresh_loop, daemon=True).start()
+    threading.Thread(target=flush_loop, daemon=True).start()
 
 
 def check_answer_ai(question, correct_answer, user_answer):
     """Use Claude Haiku to compare user answer vs correct answer. Returns score 0-100 and verdict."""
     try:
-        resp = requests.post("https://api.anthropic.com/v1/messages",
+        resp = http_client.post("https://api.anthropic.com/v1/messages",
             headers={
                 "x-api-key": ANTHROPIC_KEY,
                 "anthropic-version": "2023-06-01",
@@ -232,7 +520,6 @@ JSON: {{"score": 0-100, "verdict": "correct|partial|wrong", "feedback": "1 phras
         data = resp.json()
         text = data.get("content", [{}])[0].get("text", "")
         # Parse JSON from response
-        import re
         match = re.search(r'\{[^}]+\}', text)
         if match:
             return json.loads(match.group())
@@ -241,60 +528,325 @@ JSON: {{"score": 0-100, "verdict": "correct|partial|wrong", "feedback": "1 phras
     return None
 
 
+def check_answers_ai(items):
+    """Grade several (question, correct_answer, user_answer) items in one streamed Haiku call.
+
+    Yields (index, result) as soon as each object of the JSON array answer is complete.
+    Network and API errors propagate to the caller."""
+    listing = "\n\n".join(f"[{i}]\nQuestion: {q}\nBonne reponse: {c}\nReponse etudiant: {a}"
+                           for i, (q, c, a) in enumerate(items))
+    prompt = f"""Compare chaque reponse d'etudiant avec la bonne reponse. Reponds UNIQUEMENT avec un tableau JSON, un objet par reponse, dans l'ordre.
+
+{listing}
+
+JSON: [{{"i": numero, "score": 0-100, "verdict": "correct|partial|wrong", "feedback": "1 phrase courte"}}, ...]"""
+    with http_client.post("https://api.anthropic.com/v1/messages",
+            headers={
+                "x-api-key": ANTHROPIC_KEY,
+                "anthropic-version": "2023-06-01",
+                "Content-Type": "application/json",
+            },
+            json={
+                "model": "claude-haiku-4-5-20251001",
+                "max_tokens": 80 * len(items) + 50,
+                "stream": True,
+                "messages": [{"role": "user", "content": prompt}],
+            },
+            stream=True, timeout=(5, 30)) as resp:
+        resp.raise_for_status()
+        text, parsed = "", 0
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            event = json.loads(line[5:])
+            if event.get("type") != "content_block_delta":
+                continue
+            text += event["delta"].get("text", "")
+            # Decode every array element completed by this delta
+            while (start := text.find("{", parsed)) != -1:
+                try:
+                    result, parsed = _json_decoder.raw_decode(text, start)
+                except ValueError:
+                    break  # object still incomplete
+                i = result.pop("i", None) if isinstance(result, dict) else None
+                if isinstance(i, int) and 0 <= i < len(items):
+                    yield i, result
+
+
+def grade_batch(items):
+    """Grade (id, question, correct, answer) items for /api/check/batch.
+
+    Yields (id, result): local and cached grades first, then the model's grades
+    as they stream in, CHECK_BATCH_MAX answers per call. result is None for
+    answers the model could not grade."""
+    pending = []
+    for item in items:
+        result = grading_cache.lookup(*item[1:], local_fn=grade_locally)
+        if result is not None:
+            yield item[0], result
+        else:
+            pending.append(item)
+
+    for chunk in _chunks(pending, CHECK_BATCH_MAX):
+        started = time.perf_counter()
+        graded = set()
+        try:
+            for i, result in check_answers_ai([item[1:] for item in chunk]):
+                if i in graded:
+                    continue
+                graded.add(i)
+                grading_cache.store(*chunk[i][1:], result, started)
+                yield chunk[i][0], result
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print(f"Batch check error ({len(chunk) - len(graded)} answers ungraded): {e}", file=sys.stderr)
+        for i, item in enumerate(chunk):
+            if i not in graded:
+                yield item[0], None
+
+
+def edit_distance(a, b):
+    """Levenshtein distance between two strings."""
+    if len(a) < len(b):
+        a, b = b, a
+    previous = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        current = [i]
+        for j, cb in enumerate(b, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ca != cb)))
+        previous = current
+    return previous[-1]
+
+
+def similarity(correct, answer):
+    """(token overlap, edit similarity) of two normalized answers, both 0-1."""
+    tokens_c, tokens_a = set(correct.split()), set(answer.split())
+    overlap = len(tokens_c & tokens_a) / len(tokens_c | tokens_a) if tokens_c | tokens_a else 0.0
+    longest = max(len(correct), len(answer))
+    edit = 1 - edit_distance(correct, answer) / longest if longest else 1.0
+    return overlap, edit
+
+
+def single_typo(correct, answer):
+    """True if answer is correct with one letter dropped or added, or two
+    adjacent letters swapped. A substituted letter is not a typo: it too
+    often makes another word (isotope/isotone, Autriche/Autruche)."""
+    if len(correct) == len(answer):
+        diff = [i for i, (c, a) in enumerate(zip(correct, answer)) if c != a]
+        return (len(diff) == 2 and diff[1] == diff[0] + 1
+                and correct[diff[0]] == answer[diff[1]] and correct[diff[1]] == answer[diff[0]])
+    shorter, longer = sorted((correct, answer), key=len)
+    if len(longer) - len(shorter) != 1:
+        return False
+    return any(longer[:i] + longer[i + 1:] == shorter for i in range(len(longer)))
+
+
+def needs_model(text):
+    """True if a normalized answer holds a number or a short word, whose
+    meaning string similarity cannot judge (deux/2, USA, H2O)."""
+    return any(len(token) <= SHORT_TOKEN or re.search(r"\d", token) for token in text.split())
+
+
+def typo_only(correct, answer):
+    """True if two normalized answers differ only by typos inside long words:
+    same words in the same order, each differing pair at least TYPO_MIN_LENGTH
+    long, digit-free and a single_typo apart."""
+    tokens_c, tokens_a = correct.split(), answer.split()
+    if len(tokens_c) != len(tokens_a):
+        return False
+    for c, a in zip(tokens_c, tokens_a):
+        if c == a:
+            continue
+        if min(len(c), len(a)) < TYPO_MIN_LENGTH or re.search(r"\d", c + a):
+            return False
+        if not single_typo(c, a):
+            return False
+    return True
+
+
+def grade_locally(correct_answer, user_answer):
+    """Decide clear-cut answers without the model. Returns a result dict, or None if ambiguous."""
+    result = grading_cache.score_locally(correct_answer, user_answer)
+    if result is not None:
+        return result
+    correct = grading_cache.normalize(correct_answer)
+    answer = grading_cache.normalize(user_answer)
+    if len(correct.split()) > LOCAL_MAX_TOKENS or len(answer.split()) > LOCAL_MAX_TOKENS:
+        return None
+    overlap, edit = similarity(correct, answer)
+    # A typo in a long word is forgiven; a different number, numeral, short word or negation is not
+    if typo_only(correct, answer):
+        return {"score": round(edit * 100), "verdict": "correct", "feedback": "Correct (a une faute pres)."}
+    # Numbers and short words can match with no letters in common (2/deux, USA/Etats-Unis)
+    if max(overlap, edit) <= REJECT_SIMILARITY and not needs_model(correct) and not needs_model(answer):
+        return {"score": round(max(overlap, edit) * 100), "verdict": "wrong",
+                "feedback": f"La bonne reponse etait : {correct_answer}"}
+    return None
+
+
+def grader_stats():
+    """Grades resolved per tier (local, cache, deduplicated, api) and the thresholds in use."""
+    return {"tiers": grading_cache.get_stats(),
+            "thresholds": {"typo_min_length": TYPO_MIN_LENGTH, "reject": REJECT_SIMILARITY,
+                           "max_tokens": LOCAL_MAX_TOKENS}}
+
+
+@contextmanager
+def route_slot(path):
+    """Hold a concurrency slot for the route; yields False when the route is saturated."""
+    slot = _route_slots.get(path.split("?", 1)[0])
+    if slot is None:
+        yield True
+        return
+    if not slot.acquire(timeout=ROUTE_WAIT_SECONDS):
+        yield False
+        return
+    try:
+        yield True
+    finally:
+        slot.release()
+
+
+class PooledHTTPServer(ThreadingHTTPServer):
+    """ThreadingHTTPServer backed by a bounded worker pool instead of a thread per request."""
+
+    def __init__(self, server_address, handler_class, workers=WORKERS):
+        super().__init__(server_address, handler_class)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="http")
+
+    def process_request(self, request, client_address):
+        self._pool.submit(self.process_request_thread, request, client_address)
+
+    def server_close(self):
+        super().server_close()
+        self._pool.shutdown(wait=False)
+
+
 class FlashcardHandler(SimpleHTTPRequestHandler):
     def do_GET(self):
+        with route_slot(self.path) as ok:
+            if not ok:
+                return self.send_busy()
+            self.handle_get()
+
+    def do_POST(self):
+        with route_slot(self.path) as ok:
+            if not ok:
+                return self.send_busy()
+            self.handle_post()
+
+    def send_json(self, data, status=200):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(json.dumps(data, ensure_ascii=False).encode())
+
+    def send_cached(self, etag, raw, gzipped):
+        """Send a precomputed JSON body: 304 if the client has it, gzipped if accepted."""
+        matches = [t.strip().removeprefix("W/") for t in self.headers.get("If-None-Match", "").split(",")]
+        if etag in matches or "*" in matches:
+            self.send_response(304)
+            self.send_header("ETag", etag)
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            return
+        use_gzip = "gzip" in self.headers.get("Accept-Encoding", "")
+        body = gzipped if use_gzip else raw
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        if use_gzip:
+            self.send_header("Content-Encoding", "gzip")
+        self.send_header("ETag", etag)
+        self.send_header("Cache-Control", "no-cache")  # always revalidate, usually a 304
+        self.send_header("Vary", "Accept-Encoding")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_busy(self):
+        self.send_response(503)
+        self.send_header("Retry-After", "1")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+
+    def handle_get(self):
         if self.path == "/" or self.path == "/index.html":
             self.path = "/flashcards_app.html"
             return SimpleHTTPRequestHandler.do_GET(self)
         elif self.path == "/api/cards":
-            cards = query_flashcards()
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Access-Control-Allow-Origin", "*")
-            self.end_headers()
-            self.wfile.write(json.dumps(cards, ensure_ascii=False).encode())
+            # Key read before building: a change racing the build only costs a rebuild
+            self.send_cached(*cached_body("/api/cards", card_store.generation(), get_cards))
         elif self.path == "/api/due":
-            cards = query_flashcards()
             today = datetime.now().strftime("%Y-%m-%d")
-            due = [c for c in cards if not c["next_review"] or c["next_review"] <= today]
-            self.send_response(200)
-            self.send_header("Content-Type", "application/json")
-            self.send_header("Access-Control-Allow-Origin", "*")
-            self.end_headers()
-            self.wfile.write(json.dumps(due, ensure_ascii=False).encode())
+            self.send_cached(*cached_body("/api/due", (card_store.generation(), today),
+                                          lambda: with_preview(due_cards(today))))
+        elif self.path.startswith("/api/upcoming"):
+            query = parse_qs(urlsplit(self.path).query)
+            try:
+                days = max(1, min(365, int(query.get("days", ["7"])[0])))
+            except ValueError:
+                days = 7
+            self.send_json(upcoming_workload(days))
+        elif self.path == "/api/check/stats":
+            self.send_json(grader_stats())
         else:
             SimpleHTTPRequestHandler.do_GET(self)
 
-    def do_POST(self):
+    def handle_post(self):
         if self.path == "/api/check":
             length = int(self.headers.get("Content-Length", 0))
             body = json.loads(self.rfile.read(length))
-            result = check_answer_ai(body.get("question", ""), body.get("correct", ""), body.get("answer", ""))
+            result = grading_cache.grade(body.get("question", ""), body.get("correct", ""), body.get("answer", ""),
+                                         check_answer_ai, local_fn=grade_locally)
             self.send_response(200)
             self.send_header("Content-Type", "application/json")
             self.send_header("Access-Control-Allow-Origin", "*")
             self.end_headers()
             self.wfile.write(json.dumps(result or {"score": 0, "verdict": "error", "feedback": "Erreur IA"}, ensure_ascii=False).encode())
             return
-        elif self.path == "/api/review":
+        elif self.path == "/api/check/batch":
             length = int(self.headers.get("Content-Length", 0))
             body = json.loads(self.rfile.read(length))
+            items = [(a.get("id", ""), a.get("question", ""), a.get("correct", ""), a.get("answer", ""))
+                     for a in body.get("answers", [])]
 
-            card_id = body.get("id", "")
-            quality = body.get("quality", 3)
-            reps = body.get("repetitions", 0)
-            ef = body.get("ease_factor", 2.5)
-            interval = body.get("interval_days", 0)
-            next_review = body.get("next_review", "")
-            status = body.get("status", "Learning")
-
-            update_flashcard(card_id, quality, reps, ef, interval, next_review, status)
-
+            # One JSON object per line, flushed as each grade is known
             self.send_response(200)
-            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Type", "application/x-ndjson")
             self.send_header("Access-Control-Allow-Origin", "*")
             self.end_headers()
-            self.wfile.write(json.dumps({"ok": True}).encode())
+            for card_id, result in grade_batch(items):
+                result = result or {"score": 0, "verdict": "error", "feedback": "Erreur IA"}
+                self.wfile.write((json.dumps({"id": card_id, **result}, ensure_ascii=False) + "\n").encode())
+                self.wfile.flush()
+            return
+        elif self.path == "/api/review":
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length))
+
+            quality = parse_quality(body.get("quality"))
+            if quality is None:
+                return self.send_json({"error": "quality must be 0-5"}, status=400)
+            card = card_store.apply_review(body.get("id", ""), quality, schedule_review,
+                                           parse_review_id(body.get("review_id")))
+            if card is None:
+                return self.send_json({"error": "unknown card"}, status=404)
+            _flush_wakeup.set()
+            self.send_json({"ok": True, "card": card})
+        elif self.path == "/api/review/batch":
+            length = int(self.headers.get("Content-Length", 0))
+            try:
+                reviews = parse_reviews(json.loads(self.rfile.read(length)))
+            except ValueError:
+                reviews = None
+            if reviews is None:
+                return self.send_json({"error": "reviews must be a list of {id, quality 0-5}"}, status=400)
+            cards = card_store.apply_reviews(reviews, schedule_review)
+            _flush_wakeup.set()
+            self.send_json({"ok": True,
+                            "cards": [c for c in cards if c],
+                            "unknown": [cid for (cid, _, _), c in zip(reviews, cards) if c is None]})
         else:
             self.send_response(404)
             self.end_headers()
@@ -311,7 +863,10 @@ class FlashcardHandler(SimpleHTTPRequestHandler):
 
 
 if __name__ == "__main__":
+    if "--requeue-failed" in sys.argv:
+        print(f"{card_store.requeue_failed()} cartes remises dans la file d'envoi vers Notion")
     os.chdir(os.path.dirname(os.path.abspath(__file__)))
-    server = HTTPServer(("0.0.0.0", PORT), FlashcardHandler)
-    print(f"Flashcard server running on http://localhost:{PORT}")
+    start_sync()
+    server = PooledHTTPServer(("0.0.0.0", PORT), FlashcardHandler)
+    print(f"Flashcard server running on http://localhost:{PORT} ({WORKERS} workers)")
     server.serve_forever()
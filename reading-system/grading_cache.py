@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""Cache and deduplication in front of the AI answer check (/api/check).
+
+Answers are normalized (case, accents, punctuation, whitespace) before
+anything else: an answer that normalizes to the correct one is scored
+locally, and every other (question, correct, answer) triple is graded by
+the model at most once. Results live in an LRU that is persisted as an
+append-only JSONL file, compacted when it grows past twice its capacity.
+Identical checks arriving while one is in flight wait for its result
+instead of calling the API again. grade() counts which tier resolved each
+check and how long it took (get_stats)."""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+CACHE_FILE = os.environ.get("GRADING_CACHE_FILE", os.path.expanduser("~/.cache/flashcards-grading.jsonl"))
+MAX_ENTRIES = int(os.environ.get("GRADING_CACHE_SIZE", 5000))
+INFLIGHT_WAIT_SECONDS = 15
+
+_entries = None
+_lines_on_disk = 0
+_inflight = {}
+_lock = threading.Lock()
+# Grades resolved per tier, with the time they took (ms), for threshold tuning
+stats = {tier: {"count": 0, "ms": 0.0} for tier in ("local", "cache", "deduplicated", "api")}
+
+
+def normalize(text):
+    """Lowercase, strip accents, drop punctuation that carries no meaning and
+    collapse whitespace. Signs and symbols (+ - . / % ...) are kept, so "-5"
+    and "5" or "C++" and "C" stay different; only trailing periods go."""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s+\-./%°=<>*^#&@$€£]+", " ", text.casefold())
+    return " ".join(token.rstrip(".") for token in text.split() if token.rstrip("."))
+
+
+def cache_key(question, correct, answer):
+    raw = "\x1f".join(normalize(part) for part in (question, correct, answer))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def score_locally(correct, answer):
+    """Grade trivial cases without the model. Returns a result dict, or None."""
+    given = normalize(answer)
+    if not given:
+        return {"score": 0, "verdict": "wrong", "feedback": "Pas de reponse."}
+    if given == normalize(correct):
+        return {"score": 100, "verdict": "correct", "feedback": "Reponse exacte."}
+    return None
+
+
+def _load():
+    global _entries, _lines_on_disk
+    if _entries is not None:
+        return _entries
+    _entries = OrderedDict()
+    try:
+        with open(CACHE_FILE) as f:
+            for line in f:
+                try:
+                    key, result = json.loads(line)
+                except (ValueError, TypeError):
+                    continue  # torn last line after a crash
+                _entries[key] = result
+                _entries.move_to_end(key)
+                _lines_on_disk += 1
+    except OSError:
+        pass
+    while len(_entries) > MAX_ENTRIES:
+        _entries.popitem(last=False)
+    return _entries
+
+
+def _append(key, result):
+    """Persist one entry; rewrite the file once it holds too many stale lines."""
+    global _lines_on_disk
+    os.makedirs(os.path.dirname(os.path.abspath(CACHE_FILE)), exist_ok=True)
+    if _lines_on_disk >= 2 * MAX_ENTRIES:
+        tmp = f"{CACHE_FILE}.tmp"
+        with open(tmp, "w") as f:
+            for k, r in _entries.items():
+                f.write(json.dumps([k, r], ensure_ascii=False) + "\n")
+        os.replace(tmp, CACHE_FILE)
+        _lines_on_disk = len(_entries)
+        return
+    with open(CACHE_FILE, "a") as f:
+        f.write(json.dumps([key, result], ensure_ascii=False) + "\n")
+    _lines_on_disk += 1
+
+
+def _remember(key, result):
+    entries = _load()
+    entries[key] = result
+    entries.move_to_end(key)
+    while len(entries) > MAX_ENTRIES:
+        entries.popitem(last=False)
+    try:
+        _append(key, result)
+    except OSError:
+        pass  # the in-memory cache still works
+
+
+def _count(tier, started):
+    with _lock:
+        stats[tier]["count"] += 1
+        stats[tier]["ms"] += (time.perf_counter() - started) * 1000
+
+
+def get_stats():
+    """Per-tier counts, total and mean latency in ms."""
+    with _lock:
+        return {tier: {"count": s["count"], "ms": round(s["ms"], 3),
+                       "mean_ms": round(s["ms"] / s["count"], 3) if s["count"] else None}
+                for tier, s in stats.items()}
+
+
+def lookup(question, correct, answer, local_fn=score_locally):
+    """Grade from local_fn or the cache only. Returns a result dict, or None if the model is needed."""
+    started = time.perf_counter()
+    local = local_fn(correct, answer)
+    if local is not None:
+        _count("local", started)
+        return local
+    key = cache_key(question, correct, answer)
+    with _lock:
+        entries = _load()
+        if key not in entries:
+            return None
+        entries.move_to_end(key)
+        hit = entries[key]
+    _count("cache", started)
+    return hit
+
+
+def store(question, correct, answer, result, started):
+    """Record a grade obtained outside grade() (e.g. a batch call started at perf_counter() `started`)."""
+    _count("api", started)
+    if result:
+        with _lock:
+            _remember(cache_key(question, correct, answer), result)
+
+
+def grade(question, correct, answer, grade_fn, local_fn=score_locally):
+    """Grade an answer: local_fn(correct, answer) first, then the cache, then
+    grade_fn(question, correct, answer) on a miss.
+
+    Both return a result dict, or None (undecided / failed; failures are not cached)."""
+    started = time.perf_counter()
+    hit = lookup(question, correct, answer, local_fn)
+    if hit is not None:
+        return hit
+
+    key = cache_key(question, correct, answer)
+    with _lock:
+        # Re-check under the lock that registers the call: another thread may
+        # have stored this result and retired its in-flight entry since lookup()
+        hit = _load().get(key)
+        pending = _inflight.get(key)
+        if hit is None and pending is None:
+            _inflight[key] = threading.Event()
+    if hit is not None:
+        _count("deduplicated", started)
+        return hit
+
+    if pending is not None:
+        pending.wait(INFLIGHT_WAIT_SECONDS)
+        with _lock:
+            result = _entries.get(key)
+        if result is not None:
+            _count("deduplicated", started)
+            return result
+        result = grade_fn(question, correct, answer)
+        _count("api", started)
+        return result
+
+    try:
+        result = grade_fn(question, correct, answer)
+        _count("api", started)
+        if result:
+            with _lock:
+                _remember(key, result)
+        return result
+    finally:
+        with _lock:
+            _inflight.pop(key).set()
@@ -0,0 +1,94 @@
+#!/usr/bin/env python3
+"""Shared HTTP client for the reading system (Notion, Anthropic, book APIs, n8n).
+
+One keep-alive requests.Session per host, so repeated calls reuse their
+TCP/TLS connection. Transient failures are retried with exponential backoff,
+and each host gets a cap on concurrent requests (HOST_LIMITS).
+
+POSTs (most of the Notion and n8n API) are only retried when the request
+surely was not processed: connection failures, 429 and 503."""
+
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+USER_AGENT = "ReadingSystem/1.0 (contact: prinsechris)"
+DEFAULT_TIMEOUT = 15
+POOL_SIZE = 16
+RETRIES = 3
+BACKOFF_SECONDS = 0.5    # 0.5 s, 1 s, 2 s between attempts
+
+# Max concurrent requests per host; other hosts get DEFAULT_HOST_LIMIT
+HOST_LIMITS = {
+    "www.notion.so": 8,
+    "api.anthropic.com": 4,
+    "openlibrary.org": 4,
+    "www.googleapis.com": 4,
+}
+DEFAULT_HOST_LIMIT = 8
+
+_sessions = {}
+_slots = {}
+_lock = threading.Lock()
+
+
+class _Retry(Retry):
+    """Retry 502/504 for idempotent methods only: a POST may have gone through."""
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code in (502, 504) and method.upper() not in Retry.DEFAULT_ALLOWED_METHODS:
+            return False
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+def _retry():
+    return _Retry(total=RETRIES, connect=RETRIES, read=0, status=RETRIES,
+                  backoff_factor=BACKOFF_SECONDS,
+                  status_forcelist=(429, 502, 503, 504),
+                  allowed_methods=None,  # method filtering is done in _Retry.is_retry
+                  respect_retry_after_header=True,
+                  raise_on_status=False)
+
+
+def session(url, retry=True):
+    """The pooled session for the host of `url` (retry=False: one without retries)."""
+    host = urlsplit(url).netloc
+    with _lock:
+        s = _sessions.get((host, retry))
+        if s is None:
+            s = requests.Session()
+            s.headers["User-Agent"] = USER_AGENT
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=POOL_SIZE, max_retries=_retry() if retry else 0)
+            s.mount("https://", adapter)
+            s.mount("http://", adapter)
+            _sessions[(host, retry)] = s
+        if host not in _slots:
+            _slots[host] = threading.BoundedSemaphore(HOST_LIMITS.get(host, DEFAULT_HOST_LIMIT))
+        return s, _slots[host]
+
+
+def request(method, url, retry=True, **kwargs):
+    """requests.request() through the host's pooled session and concurrency slot.
+
+    Pass retry=False when the body cannot be replayed (a stream). With
+    stream=True the slot is released once headers arrive; the connection goes
+    back to the pool when the body is consumed or the response closed."""
+    s, slot = session(url, retry)
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    with slot:
+        return s.request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    return request("POST", url, **kwargs)
+
+
+def put(url, **kwargs):
+    return request("PUT", url, **kwargs)
@@ -1,14 +1,54 @@
 #!/usr/bin/env python3
 """Upload book cover images directly to Notion pages via internal API.
-Uses getUploadFileUrl + S3 presigned URL + submitTransaction."""
+Uses getUploadFileUrl + S3 presigned URL + submitTransaction.
 
+Covers are content-addressed: a cache file maps image URLs and SHA-256
+hashes to the Notion attachment URL they were uploaded to, so a cover seen
+before is reused without getUploadFileUrl and the S3 PUT (and, for a known
+URL, without downloading it).
+
+Images up to BUFFER_BYTES are read in memory and hashed before uploading.
+Larger ones are streamed straight into the S3 PUT when the source announces
+their size (S3 presigned PUTs need a Content-Length, so no chunked encoding)
+and hashed on the way. Nothing is written to disk, so uploads can run in
+parallel. The content type comes from the image's magic bytes, not its URL."""
+
+import hashlib
+import io
 import json
 import os
 import sys
 import uuid
-import urllib.request
-import urllib.error
 import tempfile
+import threading
+from contextlib import contextmanager
+
+import http_client
+
+try:
+    from PIL import Image
+except ImportError:  # optional: covers are uploaded as-is without Pillow
+    Image = None
+
+MAX_COVER_BYTES = 10 * 1024 * 1024   # refuse anything bigger
+BUFFER_BYTES = 2 * 1024 * 1024       # hashed before upload; bigger ones stream
+DOWNSIZE_BYTES = 1024 * 1024         # with Pillow, larger images are shrunk...
+MAX_COVER_SIDE = 1600                # ...to fit in this many pixels
+CHUNK_SIZE = 64 * 1024
+
+COVER_CACHE = os.environ.get("NOTION_COVER_CACHE", os.path.expanduser("~/.cache/notion-covers.json"))
+
+_covers = None
+_covers_lock = threading.Lock()
+_source_locks = {}  # source -> [lock, uploads holding or waiting for it]
+
+# (magic bytes, content type, extension); WebP is RIFF....WEBP
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg", "jpg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png", "png"),
+    (b"GIF87a", "image/gif", "gif"),
+    (b"GIF89a", "image/gif", "gif"),
+]
 
 
 def get_token():
@@ -18,88 +58,240 @@ def get_token():
         return f.read().strip()
 
 
+def sniff_image(head):
+    """(content_type, extension) from the first bytes of an image, or (None, None)."""
+    for magic, content_type, ext in IMAGE_SIGNATURES:
+        if head.startswith(magic):
+            return content_type, ext
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp", "webp"
+    return None, None
+
+
+class StreamBody:
+    """Request body replaying `head` then the rest of a stream, with a known length.
+
+    requests sends a body that has a length with Content-Length instead of
+    chunked encoding, reading it CHUNK_SIZE at a time."""
+
+    def __init__(self, head, stream, length):
+        self.head = head
+        self.stream = stream
+        self.length = length
+        self.sha256 = hashlib.sha256()
+
+    def __len__(self):
+        return self.length
+
+    def read(self, size=-1):
+        if self.head:
+            data, self.head = self.head, b""
+        else:
+            data = self.stream.read(CHUNK_SIZE if size is None or size < 0 else size)
+        self.sha256.update(data)
+        return data
+
+
+def downsize(data, content_type):
+    """Shrink an oversized image with Pillow. Returns (data, content_type), unchanged when not needed."""
+    if Image is None or len(data) <= DOWNSIZE_BYTES or content_type == "image/gif":
+        return data, content_type
+    try:
+        img = Image.open(io.BytesIO(data))
+        img.thumbnail((MAX_COVER_SIDE, MAX_COVER_SIDE))
+        out = io.BytesIO()
+        if img.mode in ("RGBA", "LA", "P"):
+            img.save(out, "PNG", optimize=True)
+            smaller = out.getvalue(), "image/png"
+        else:
+            img.convert("RGB").save(out, "JPEG", quality=85, optimize=True)
+            smaller = out.getvalue(), "image/jpeg"
+    except Exception as e:
+        print(f"Redimensionnement impossible ({e}), image envoyee telle quelle", file=sys.stderr)
+        return data, content_type
+    return smaller if len(smaller[0]) < len(data) else (data, content_type)
+
+
+def _read_all(stream, head):
+    chunks, size = [head], len(head)
+    while chunk := stream.read(CHUNK_SIZE):
+        size += len(chunk)
+        if size > MAX_COVER_BYTES:
+            raise ValueError(f"Image trop grande (> {MAX_COVER_BYTES} octets)")
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+
+def open_image(stream, length=None):
+    """Prepare an image stream for upload.
+
+    Returns (content_type, extension, body, sha256): body is a StreamBody
+    (and sha256 None until it is sent) for images over BUFFER_BYTES with a
+    known length that need no downsizing, else the (possibly downsized) bytes
+    with the hash of the original image.
+    Raises ValueError for anything that is not a JPEG, PNG, GIF or WebP image."""
+    head = stream.read(16)
+    content_type, ext = sniff_image(head)
+    if content_type is None:
+        raise ValueError("Le fichier n'est pas une image (JPEG, PNG, GIF ou WebP)")
+    if length and length > MAX_COVER_BYTES:
+        raise ValueError(f"Image trop grande ({length} octets)")
+    if length and length > BUFFER_BYTES and Image is None:
+        return content_type, ext, StreamBody(head, stream, length), None
+    data = _read_all(stream, head)
+    digest = hashlib.sha256(data).hexdigest()
+    data, content_type = downsize(data, content_type)
+    return content_type, sniff_image(data[:16])[1], data, digest
+
+
+# --- Content-addressed cache ---
+
+def _load_covers():
+    global _covers
+    if _covers is None:
+        try:
+            with open(COVER_CACHE) as f:
+                _covers = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            _covers = {"urls": {}, "hashes": {}}
+    return _covers
+
+
+def cached_attachment(url=None, digest=None):
+    """Attachment URL already holding this image (by source URL or SHA-256), or None."""
+    with _covers_lock:
+        covers = _load_covers()
+        if url:
+            digest = covers["urls"].get(url)
+        return covers["hashes"].get(digest) if digest else None
+
+
+def remember_attachment(digest, attachment_url, url=None):
+    """Record an uploaded image, merging with entries other processes saved meanwhile."""
+    with _covers_lock:
+        covers = _load_covers()
+        covers["hashes"][digest] = attachment_url
+        if url:
+            covers["urls"][url] = digest
+        try:
+            with open(COVER_CACHE) as f:
+                on_disk = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            on_disk = {"urls": {}, "hashes": {}}
+        for table in ("urls", "hashes"):
+            covers[table] = {**on_disk.get(table, {}), **covers[table]}
+        os.makedirs(os.path.dirname(COVER_CACHE), exist_ok=True)
+        tmp = f"{COVER_CACHE}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(covers, f)
+        os.replace(tmp, COVER_CACHE)
+
+
+@contextmanager
+def _source_lock(source):
+    """Serialize uploads of the same source, so parallel duplicates wait and hit the cache.
+    A lock is dropped once no upload holds or waits for it."""
+    with _covers_lock:
+        entry = _source_locks.setdefault(source, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _covers_lock:
+            entry[1] -= 1
+            if not entry[1]:
+                del _source_locks[source]
+
+
 def download_image(url, dest_path=None):
-    """Download image from URL to local path."""
+    """Download image from URL to local path (a new temp file by default)."""
     if dest_path is None:
         ext = url.rsplit(".", 1)[-1].split("?")[0]
         if ext not in ("jpg", "jpeg", "png", "gif", "webp"):
             ext = "jpg"
-        dest_path = os.path.join(tempfile.gettempdir(), f"book_cover.{ext}")
+        fd, dest_path = tempfile.mkstemp(prefix="book_cover_", suffix=f".{ext}")
+        os.close(fd)
 
-    req = urllib.request.Request(url, headers={"User-Agent": "ReadingSystem/1.0"})
-    with urllib.request.urlopen(req, timeout=15) as resp:
+    with http_client.get(url, stream=True, timeout=15) as resp:
+        resp.raise_for_status()
         with open(dest_path, "wb") as f:
-            f.write(resp.read())
+            for chunk in resp.iter_content(CHUNK_SIZE):
+                f.write(chunk)
     return dest_path
 
 
 def get_upload_url(token, page_id, filename, content_type="image/jpeg"):
     """Get S3 presigned upload URL from Notion internal API."""
-    data = json.dumps({
-        "bucket": "secure",
-        "name": filename,
-        "contentType": content_type,
-        "record": {
-            "table": "block",
-            "id": page_id,
-        }
-    }).encode()
-
-    req = urllib.request.Request(
+    resp = http_client.post(
         "https://www.notion.so/api/v3/getUploadFileUrl",
-        data=data,
-        headers={
-            "Cookie": f"token_v2={token}",
-            "Content-Type": "application/json",
+        cookies={"token_v2": token},
+        json={
+            "bucket": "secure",
+            "name": filename,
+            "contentType": content_type,
+            "record": {
+                "table": "block",
+                "id": page_id,
+            }
         },
+        timeout=15,
     )
-
-    with urllib.request.urlopen(req, timeout=15) as resp:
-        return json.loads(resp.read().decode())
+    resp.raise_for_status()
+    return resp.json()
 
 
-def upload_to_s3(signed_put_url, file_path, content_type="image/jpeg"):
-    """Upload file to S3 via presigned PUT URL."""
-    with open(file_path, "rb") as f:
-        file_data = f.read()
+def upload_to_s3(signed_put_url, body, content_type="image/jpeg"):
+    """Upload to S3 via presigned PUT URL. body: bytes, a StreamBody or a file path."""
+    if isinstance(body, str):
+        with open(body, "rb") as f:  # streamed from disk, Content-Length from the file size
+            return upload_to_s3(signed_put_url, f, content_type)
 
-    req = urllib.request.Request(
-        signed_put_url,
-        data=file_data,
-        method="PUT",
-        headers={"Content-Type": content_type},
-    )
-
-    with urllib.request.urlopen(req, timeout=30) as resp:
-        return resp.status
+    # A stream can only be sent once: no automatic retry for those
+    resp = http_client.put(signed_put_url, data=body, headers={"Content-Type": content_type}, timeout=30,
+                           retry=isinstance(body, bytes))
+    resp.raise_for_status()
+    return resp.status_code
 
 
 def set_page_cover(token, page_id, attachment_url):
     """Set page cover via submitTransaction."""
-    data = json.dumps({
-        "requestId": str(uuid.uuid4()),
-        "transactions": [{
-            "id": str(uuid.uuid4()),
-            "operations": [{
-                "pointer": {"table": "block", "id": page_id},
-                "path": ["format", "page_cover"],
-                "command": "set",
-                "args": attachment_url,
-            }]
-        }]
-    }).encode()
-
-    req = urllib.request.Request(
+    resp = http_client.post(
         "https://www.notion.so/api/v3/submitTransaction",
-        data=data,
-        headers={
-            "Cookie": f"token_v2={token}",
-            "Content-Type": "application/json",
+        cookies={"token_v2": token},
+        json={
+            "requestId": str(uuid.uuid4()),
+            "transactions": [{
+                "id": str(uuid.uuid4()),
+                "operations": [{
+                    "pointer": {"table": "block", "id": page_id},
+                    "path": ["format", "page_cover"],
+                    "command": "set",
+                    "args": attachment_url,
+                }]
+            }]
         },
+        timeout=15,
     )
+    resp.raise_for_status()
+    return resp.status_code
 
-    with urllib.request.urlopen(req, timeout=15) as resp:
-        return resp.status
+
+@contextmanager
+def _open_source(image_url, image_path):
+    """Yield open_image() for a cover URL or local file: (content_type, extension, body, sha256)."""
+    if image_url:
+        print(f"Telechargement: {image_url}")
+        with http_client.get(image_url, stream=True, timeout=15) as resp:
+            resp.raise_for_status()
+            # A compressed transfer has no usable length: buffer it (decoded) instead
+            encoded = resp.headers.get("Content-Encoding", "identity") != "identity"
+            length = None if encoded else int(resp.headers.get("Content-Length") or 0) or None
+            resp.raw.decode_content = True
+            yield open_image(resp.raw, length)
+    else:
+        with open(image_path, "rb") as f:
+            yield open_image(f, os.fstat(f.fileno()).st_size)
 
 
 def upload_cover(page_id, image_url=None, image_path=None):
@@ -115,33 +307,39 @@ def upload_cover(page_id, image_url=None, image_path=None):
         dict with status and attachment URL
     """
     token = get_token()
-
-    # Download if URL provided
-    if image_url and not image_path:
-        print(f"Telechargement: {image_url}")
-        image_path = download_image(image_url)
-
-    if not image_path or not os.path.exists(image_path):
+    if not image_url and not (image_path and os.path.exists(image_path)):
         return {"error": "Pas d'image trouvee"}
 
-    filename = os.path.basename(image_path)
-    # Detect content type
-    ext = filename.rsplit(".", 1)[-1].lower()
-    content_types = {"jpg": "image/jpeg", "jpeg": "image/jpeg", "png": "image/png",
-                     "gif": "image/gif", "webp": "image/webp"}
-    content_type = content_types.get(ext, "image/jpeg")
-
-    # Step 1: Get presigned URL
-    print(f"Obtention URL S3 pour {filename}...")
-    upload_info = get_upload_url(token, page_id, filename, content_type)
-    signed_put_url = upload_info["signedPutUrl"]
-    attachment_url = upload_info["url"]
-
-    # Step 2: Upload to S3
-    print(f"Upload vers S3...")
-    status = upload_to_s3(signed_put_url, image_path, content_type)
-    if status != 200:
-        return {"error": f"Upload S3 echoue: {status}"}
+    with _source_lock(image_url or os.path.abspath(image_path)):
+        upload_info = {}
+        attachment_url = cached_attachment(url=image_url) if image_url else None
+        if attachment_url:
+            print(f"Cover deja envoyee: {image_url}")
+        else:
+            try:
+                with _open_source(image_url, image_path) as (content_type, ext, body, digest):
+                    attachment_url = cached_attachment(digest=digest) if digest else None
+                    if attachment_url:
+                        print("Image identique deja envoyee, reutilisee")
+                    else:
+                        filename = (f"cover.{ext}" if image_url else
+                                    os.path.splitext(os.path.basename(image_path))[0] + f".{ext}")
+
+                        # Step 1: Get presigned URL
+                        print(f"Obtention URL S3 pour {filename}...")
+                        upload_info = get_upload_url(token, page_id, filename, content_type)
+                        signed_put_url = upload_info["signedPutUrl"]
+                        attachment_url = upload_info["url"]
+
+                        # Step 2: Upload to S3 (a streamed download goes through as it is sent)
+                        print(f"Upload vers S3...")
+                        status = upload_to_s3(signed_put_url, body, content_type)
+                        if status != 200:
+                            return {"error": f"Upload S3 echoue: {status}"}
+                        digest = digest or body.sha256.hexdigest()
+                    remember_attachment(digest, attachment_url, image_url)
+            except ValueError as e:  # not an image, or too big
+                return {"error": str(e)}
 
     # Step 3: Set as page cover
     print(f"Mise a jour de la cover Notion...")
@@ -152,6 +350,7 @@ def upload_cover(page_id, image_url=None, image_path=None):
         "status": "success",
         "attachment_url": attachment_url,
         "signed_get_url": upload_info.get("signedGetUrl", ""),
+        "reused": not upload_info,
     }
 
 
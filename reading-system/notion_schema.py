@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+"""Shared cache for Notion collection schemas (property name -> property ID).
+
+Entries persist on disk across runs. Inside SCHEMA_TTL they are served with
+no request at all; once stale they are revalidated against the collection
+record version, and a caller that sees a newer version elsewhere (e.g. in a
+queryCollection recordMap) can drop the entry with observe_version()."""
+
+import json
+import os
+import threading
+import time
+
+import http_client
+
+API = "https://www.notion.so/api/v3"
+CACHE_FILE = os.environ.get("NOTION_SCHEMA_CACHE", os.path.expanduser("~/.cache/notion-schemas.json"))
+SCHEMA_TTL = int(os.environ.get("NOTION_SCHEMA_TTL", 3600))
+
+_entries = None
+_lock = threading.Lock()
+
+
+def _load():
+    global _entries
+    if _entries is None:
+        try:
+            with open(CACHE_FILE) as f:
+                _entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            _entries = {}
+    return _entries
+
+
+def _save(collection_id):
+    """Write one entry back, merging with whatever other processes saved meanwhile."""
+    try:
+        with open(CACHE_FILE) as f:
+            on_disk = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        on_disk = {}
+    if collection_id in _entries:
+        on_disk[collection_id] = _entries[collection_id]
+    else:
+        on_disk.pop(collection_id, None)
+    os.makedirs(os.path.dirname(CACHE_FILE), exist_ok=True)
+    tmp = f"{CACHE_FILE}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(on_disk, f)
+    os.replace(tmp, CACHE_FILE)
+
+
+def _auth_kwargs(auth):
+    """Request arguments for `auth`: a token_v2 string, or the caller's own headers."""
+    if isinstance(auth, dict):
+        return {"headers": {"Content-Type": "application/json", **auth}}
+    return {"cookies": {"token_v2": auth}, "headers": {"Content-Type": "application/json"}}
+
+
+def fetch_collection(auth, collection_id, version=-1):
+    """Fetch a collection record. Returns (schema, version); schema is None if nothing came back."""
+    resp = http_client.post(f"{API}/syncRecordValues",
+        **_auth_kwargs(auth),
+        json={"requests": [{"pointer": {"table": "collection", "id": collection_id}, "version": version}]},
+        timeout=15)
+    value = resp.json().get("recordMap", {}).get("collection", {}).get(collection_id, {}).get("value", {})
+    if not value:
+        return None, version
+    return value.get("schema", {}), value.get("version", 0)
+
+
+def get_schema(auth, collection_id):
+    """Property name -> property ID for a collection, served from cache when possible.
+    `auth` is a token_v2 string or request headers carrying the Notion cookie."""
+    with _lock:
+        entry = _load().get(collection_id)
+        if entry and time.time() - entry["fetched_at"] < SCHEMA_TTL:
+            return dict(entry["props"])
+
+    schema, version = fetch_collection(auth, collection_id, entry["version"] if entry else -1)
+
+    with _lock:
+        if schema is not None:
+            entry = {"props": {info.get("name", ""): pid for pid, info in schema.items()},
+                     "version": version}
+        elif not entry:
+            return {}
+        # Nothing returned for a known version means the schema is unchanged
+        entry["fetched_at"] = time.time()
+        _load()[collection_id] = entry
+        _save(collection_id)
+        return dict(entry["props"])
+
+
+def observe_version(collection_id, version):
+    """Invalidate the cached schema if `version` is newer than the one it was built from."""
+    with _lock:
+        entry = _load().get(collection_id)
+        if entry and version and version > entry["version"]:
+            del _entries[collection_id]
+            _save(collection_id)
+
+
+def invalidate(collection_id):
+    with _lock:
+        if _load().pop(collection_id, None) is not None:
+            _save(collection_id)
@@ -12,13 +12,12 @@ Usage in Orun:
 import json
 import os
 import sys
-import urllib.request
-import urllib.parse
 from datetime import datetime, timedelta
 
 # Import local modules
 sys.path.insert(0, os.path.dirname(__file__))
-from book_search import search_google_books, search_open_library, get_table_of_contents
+import http_client
+from book_search import search_concurrent
 from sm2 import sm2
 
 # Notion config
@@ -41,15 +40,10 @@ def notion_query(collection_id, filter_obj=None, sorts=None, limit=50):
         "sorts": sorts or [],
         "limit": limit,
     }
-    data = json.dumps(payload).encode()
-    req = urllib.request.Request(
-        f"{N8N_BASE}/webhook/notion-query",
-        data=data,
-        headers={"Content-Type": "application/json"},
-    )
     try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return json.loads(resp.read().decode())
+        resp = http_client.post(f"{N8N_BASE}/webhook/notion-query", json=payload, timeout=15)
+        resp.raise_for_status()
+        return resp.json()
     except Exception as e:
         print(f"Notion query error: {e}", file=sys.stderr)
         return {}
@@ -62,15 +56,10 @@ def notion_create(collection_id, properties):
         "collection_id": collection_id,
         "properties": properties,
     }
-    data = json.dumps(payload).encode()
-    req = urllib.request.Request(
-        f"{N8N_BASE}/webhook/notion-create-task",
-        data=data,
-        headers={"Content-Type": "application/json"},
-    )
     try:
-        with urllib.request.urlopen(req, timeout=15) as resp:
-            return json.loads(resp.read().decode())
+        resp = http_client.post(f"{N8N_BASE}/webhook/notion-create-task", json=payload, timeout=15)
+        resp.raise_for_status()
+        return resp.json()
     except Exception as e:
         print(f"Notion create error: {e}", file=sys.stderr)
         return {}
@@ -78,8 +67,7 @@ def notion_create(collection_id, properties):
 
 def search_and_add_book(query):
     """Search for a book and return metadata for Notion."""
-    google_results = search_google_books(query, max_results=1)
-    ol_results = search_open_library(query, max_results=1)
+    google_results, ol_results, toc = search_concurrent(query, max_results=1)
 
     if not google_results and not ol_results:
         return {"error": "Aucun livre trouve"}
@@ -99,16 +87,9 @@ def search_and_add_book(query):
             "categories": g["categories"],
         }
 
-    # Get TOC from Open Library
-    toc = []
-    if ol_results:
-        o = ol_results[0]
-        if not book.get("page_count"):
-            book["page_count"] = o["page_count"]
-        for ek in o.get("edition_keys", [])[:3]:
-            toc = get_table_of_contents(ek)
-            if toc:
-                break
+    # TOC comes from Open Library (fetched concurrently by search_concurrent)
+    if ol_results and not book.get("page_count"):
+        book["page_count"] = ol_results[0]["page_count"]
 
     book["table_of_contents"] = toc
     return book
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""Pluggable review schedulers: SM-2 and an FSRS-style memory model.
+
+Every scheduler takes a stored card plus a 0-5 quality rating and returns the
+fields to write back (repetitions, ease_factor, interval_days, next_review,
+status, plus any scheduler-specific state). Statuses always come from
+sm2.card_status so the thresholds live in one place.
+
+FSRS follows the FSRS-4.5 formulas. Its 17 weights start from the published
+defaults and can be fitted to our own review log:
+    python schedulers.py fit            # fit on card_store's review log
+    python schedulers.py show           # print the weights in use
+"""
+
+import json
+import math
+import os
+import sys
+from datetime import date, datetime, timedelta
+from typing import Protocol
+
+from sm2 import sm2, card_status
+
+
+class Scheduler(Protocol):
+    name: str
+
+    def review(self, card: dict, quality: int, today: date | None = None) -> dict:
+        """Fields to store on `card` after a review rated `quality` (0-5)."""
+        ...
+
+
+class SM2Scheduler:
+    name = "sm2"
+
+    def review(self, card, quality, today=None):
+        return sm2(quality, card.get("repetitions", 0), card.get("ease_factor", 2.5),
+                   card.get("interval_days", 0), today=today)
+
+
+# FSRS-4.5 default weights
+FSRS_DEFAULT_WEIGHTS = [
+    0.4872, 1.4003, 3.7145, 13.8206, 5.1618, 1.2298, 0.8975, 0.031, 1.6474,
+    0.1367, 1.0461, 2.1072, 0.0793, 0.3246, 1.587, 0.2272, 2.8755,
+]
+FSRS_DECAY = -0.5
+FSRS_FACTOR = 19 / 81  # makes retrievability 0.9 when elapsed == stability
+MAX_INTERVAL = 36500
+
+# Scheduler state kept on cards in the local store only (not written to Notion).
+# Prefixed so it cannot clash with Notion properties such as Difficulty.
+LOCAL_STATE_KEYS = ("fsrs_stability", "fsrs_difficulty")
+
+
+def grade_from_quality(quality):
+    """SM-2 quality 0-5 -> FSRS grade 1 (again), 2 (hard), 3 (good), 4 (easy)."""
+    if quality < 3:
+        return 1
+    return {3: 2, 4: 3}.get(quality, 4)
+
+
+def _days_between(start, end):
+    return (end - date.fromisoformat(start[:10])).days
+
+
+class FSRSScheduler:
+    """Memory-model scheduler: tracks per-card stability and difficulty and
+    schedules the next review when predicted recall falls to desired_retention."""
+
+    name = "fsrs"
+
+    def __init__(self, weights=None, desired_retention=0.9):
+        self.w = list(weights or FSRS_DEFAULT_WEIGHTS)
+        self.desired_retention = desired_retention
+
+    def retrievability(self, elapsed, stability):
+        return (1 + FSRS_FACTOR * elapsed / stability) ** FSRS_DECAY
+
+    def interval(self, stability):
+        days = stability / FSRS_FACTOR * (self.desired_retention ** (1 / FSRS_DECAY) - 1)
+        return max(1, min(MAX_INTERVAL, round(days)))
+
+    def init_stability(self, grade):
+        return max(0.1, self.w[grade - 1])
+
+    def init_difficulty(self, grade):
+        return min(10.0, max(1.0, self.w[4] - (grade - 3) * self.w[5]))
+
+    def next_difficulty(self, difficulty, grade):
+        d = difficulty - self.w[6] * (grade - 3)
+        # Mean reversion towards the initial difficulty of a "good" first answer
+        d = self.w[7] * self.init_difficulty(3) + (1 - self.w[7]) * d
+        return min(10.0, max(1.0, d))
+
+    def next_stability(self, stability, difficulty, elapsed, grade):
+        r = self.retrievability(elapsed, stability)
+        w = self.w
+        if grade == 1:
+            s = (w[11] * difficulty ** -w[12] * ((stability + 1) ** w[13] - 1)
+                 * math.exp(w[14] * (1 - r)))
+            return max(0.1, min(s, stability))
+        hard_penalty = w[15] if grade == 2 else 1.0
+        easy_bonus = w[16] if grade == 4 else 1.0
+        growth = (math.exp(w[8]) * (11 - difficulty) * stability ** -w[9]
+                  * (math.exp(w[10] * (1 - r)) - 1) * hard_penalty * easy_bonus)
+        return stability * (1 + growth)
+
+    def step(self, stability, difficulty, elapsed, grade):
+        """(stability, difficulty) after a review; stability None means a first review."""
+        if stability is None:
+            return self.init_stability(grade), self.init_difficulty(grade)
+        return (self.next_stability(stability, difficulty, elapsed, grade),
+                self.next_difficulty(difficulty, grade))
+
+    def review(self, card, quality, today=None):
+        today = today or datetime.now().date()
+        grade = grade_from_quality(quality)
+        stability = card.get("fsrs_stability")
+        difficulty = card.get("fsrs_difficulty")
+        last = card.get("last_reviewed")
+        elapsed = _days_between(last, today) if last else card.get("interval_days", 0)
+
+        if not stability and card.get("repetitions"):
+            # Card scheduled by SM-2 so far: its current interval is the best stability guess
+            stability = max(1.0, float(card.get("interval_days") or 1))
+            difficulty = self.init_difficulty(3)
+        stability, difficulty = self.step(stability or None, difficulty, elapsed, grade)
+
+        interval = self.interval(stability)
+        repetitions = card.get("repetitions", 0) + 1 if grade > 1 else 0
+        return {
+            "repetitions": repetitions,
+            "ease_factor": card.get("ease_factor", 2.5),
+            "interval_days": interval,
+            "next_review": (today + timedelta(days=interval)).isoformat(),
+            "status": card_status(repetitions, interval),
+            "fsrs_stability": round(stability, 4),
+            "fsrs_difficulty": round(difficulty, 4),
+        }
+
+
+# --- Fitting ---
+
+# Weights adjusted by fit_fsrs: initial stabilities, recall growth and lapse stability
+FIT_WEIGHTS = (0, 1, 2, 3, 8, 9, 10, 11, 15, 16)
+MIN_FIT_REVIEWS = 50
+
+
+def _sequences(history):
+    """Group (card_id, reviewed_on, quality) rows into per-card [(date, grade)] lists."""
+    cards = {}
+    for card_id, reviewed_on, quality in history:
+        if reviewed_on:
+            cards.setdefault(card_id, []).append((date.fromisoformat(reviewed_on[:10]), grade_from_quality(quality)))
+    return [sorted(seq) for seq in cards.values() if len(seq) > 1]
+
+
+def log_loss(scheduler, sequences):
+    """Mean log loss of predicted recall against actual outcomes. Returns (loss, n_predictions)."""
+    total, n = 0.0, 0
+    for seq in sequences:
+        stability = difficulty = None
+        last = None
+        for day, grade in seq:
+            elapsed = (day - last).days if last else 0
+            if stability is not None and elapsed > 0:
+                r = min(max(scheduler.retrievability(elapsed, stability), 1e-6), 1 - 1e-6)
+                total -= math.log(r if grade > 1 else 1 - r)
+                n += 1
+            if stability is None or elapsed > 0:
+                stability, difficulty = scheduler.step(stability, difficulty, elapsed, grade)
+            last = day
+    return (total / n if n else 0.0), n
+
+
+def fit_fsrs(history, weights=None, rounds=6):
+    """Fit FSRS weights to a review log by multiplicative coordinate search on log loss.
+
+    history: iterable of (card_id, reviewed_on ISO date, quality 0-5).
+    Returns (weights, loss, n_predictions); defaults come back unchanged when
+    there are fewer than MIN_FIT_REVIEWS predictable reviews."""
+    sequences = _sequences(history)
+    w = list(weights or FSRS_DEFAULT_WEIGHTS)
+    best, n = log_loss(FSRSScheduler(w), sequences)
+    if n < MIN_FIT_REVIEWS:
+        return w, best, n
+
+    step = 1.5
+    for _ in range(rounds):
+        for i in FIT_WEIGHTS:
+            for factor in (step, 1 / step):
+                candidate = list(w)
+                candidate[i] *= factor
+                loss, _ = log_loss(FSRSScheduler(candidate), sequences)
+                if loss < best:
+                    w, best = candidate, loss
+                    break
+        step = 1 + (step - 1) / 2
+    return w, best, n
+
+
+# --- Configuration ---
+
+PARAMS_FILE = os.environ.get("FSRS_PARAMS_FILE", os.path.expanduser("~/.cache/fsrs_params.json"))
+
+
+def load_weights(path=None):
+    try:
+        with open(path or PARAMS_FILE) as f:
+            return json.load(f)["weights"]
+    except (OSError, json.JSONDecodeError, KeyError):
+        return None
+
+
+def save_weights(weights, loss, n, path=None):
+    path = path or PARAMS_FILE
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w") as f:
+        json.dump({"weights": weights, "log_loss": loss, "reviews": n,
+                   "fitted_at": datetime.now().isoformat(timespec="seconds")}, f, indent=2)
+
+
+def get_scheduler(name="sm2"):
+    """Scheduler by name ("sm2" or "fsrs"); FSRS picks up fitted weights if present."""
+    if name == "fsrs":
+        return FSRSScheduler(load_weights())
+    if name == "sm2":
+        return SM2Scheduler()
+    raise ValueError(f"Unknown scheduler: {name}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ("fit", "show"):
+        print("Usage: python schedulers.py fit | show")
+        sys.exit(1)
+
+    if sys.argv[1] == "show":
+        weights = load_weights()
+        print(f"Poids FSRS ({'ajustes' if weights else 'par defaut'}): {weights or FSRS_DEFAULT_WEIGHTS}")
+        sys.exit(0)
+
+    import card_store
+    history = card_store.review_history()
+    default_loss, _ = log_loss(FSRSScheduler(), _sequences(history))
+    weights, loss, n = fit_fsrs(history)
+    if n < MIN_FIT_REVIEWS:
+        print(f"Pas assez d'historique: {n} revisions exploitables (minimum {MIN_FIT_REVIEWS})")
+        sys.exit(1)
+    save_weights(weights, loss, n)
+    print(f"{n} revisions, log loss {default_loss:.4f} -> {loss:.4f}")
+    print(f"Poids enregistres dans {PARAMS_FILE}")
@@ -0,0 +1,257 @@
+#!/usr/bin/env python3
+"""Review-session simulator and benchmark for the SM-2 scheduling code.
+
+Generates a synthetic deck, introduces new cards every day and replays many
+days of reviews through a scheduler from schedulers.py (SM-2 or FSRS) and
+get_due_cards(), or through the vectorized sm2_batch engine. Each card carries a hidden memory stability; a recall
+model turns elapsed time into a recall probability, which becomes the
+quality rating. Reports daily workload, retention and scheduling time.
+
+Usage:
+    python simulate.py --cards 100000 --days 180
+    python simulate.py --cards 1000000 --new-per-day 500 --engine batch --recall power
+    python simulate.py --cards 10000 --json > run.json
+    python simulate.py --cards 20000 --scheduler fsrs   # compare against the sm2 run
+"""
+
+import argparse
+import json
+import math
+import random
+import statistics
+import sys
+import time
+from datetime import date, timedelta
+
+from schedulers import get_scheduler
+from sm2 import get_due_cards
+
+# Recall probability after `elapsed` days. Stability is the delay (in days) at
+# which recall drops to 90%, in every model.
+RECALL_MODELS = {
+    "exponential": lambda elapsed, stability: 0.9 ** (elapsed / stability),
+    "power": lambda elapsed, stability: (1 + elapsed / (9 * stability)) ** -1,
+    "constant": lambda elapsed, stability: 0.9,
+}
+
+FIRST_EXPOSURE_RECALL = 0.6   # chance of answering a brand new card correctly
+INITIAL_STABILITY = 1.5       # days
+LAPSE_FACTOR = 0.3            # stability kept after a failed recall
+
+
+def quality_from_recall(recalled, p, rng):
+    """Map a simulated recall to a 0-5 rating: confident recalls score higher."""
+    if not recalled:
+        return rng.choice((0, 1, 2))
+    if p > 0.9:
+        return 5
+    return 4 if p > 0.7 else 3
+
+
+def grow_stability(stability, difficulty, recalled, p):
+    """Update hidden stability after a review. Harder cards grow more slowly;
+    successful recalls at low p (desirable difficulty) grow stability most."""
+    if not recalled:
+        return max(0.5, stability * LAPSE_FACTOR)
+    return stability * (1 + (3.0 - difficulty) * (1.5 - p) * 1.8)
+
+
+def make_deck(n, rng):
+    """Synthetic deck: scheduling fields as stored by the server, plus hidden memory state."""
+    return [{
+        "id": i,
+        "repetitions": 0,
+        "ease_factor": 2.5,
+        "interval_days": 0,
+        "next_review": "",
+        "memory_stability": INITIAL_STABILITY,
+        "memory_difficulty": rng.uniform(0.5, 2.5),
+        "last_review": None,
+    } for i in range(n)]
+
+
+def simulate(n_cards, days, new_per_day, recall="exponential", seed=0, start=None, scheduler="sm2"):
+    """Replay `days` days of reviews with a scheduler and get_due_cards(). Returns one stats dict per day."""
+    rng = random.Random(seed)
+    scheduler = get_scheduler(scheduler)
+    recall_p = RECALL_MODELS[recall]
+    deck = make_deck(n_cards, rng)
+    active = []
+    start = start or date.today()
+    stats = []
+
+    for day in range(days):
+        today = start + timedelta(days=day)
+        active.extend(deck[len(active):len(active) + new_per_day])
+
+        sched = 0.0
+        t0 = time.perf_counter()
+        due = get_due_cards(active, today)
+        sched += time.perf_counter() - t0
+
+        reviews = recalled_count = lapses = new = 0
+        for card in due:
+            if card["last_review"] is None:
+                p = FIRST_EXPOSURE_RECALL
+                new += 1
+            else:
+                p = recall_p((today - card["last_review"]).days, card["memory_stability"])
+                reviews += 1
+            recalled = rng.random() < p
+            if card["last_review"] is not None:
+                recalled_count += recalled
+                lapses += not recalled
+            quality = quality_from_recall(recalled, p, rng)
+
+            t0 = time.perf_counter()
+            result = scheduler.review(card, quality, today)
+            sched += time.perf_counter() - t0
+
+            card.update(result)
+            card["last_reviewed"] = today.isoformat()
+            card["memory_stability"] = grow_stability(card["memory_stability"], card["memory_difficulty"], recalled, p)
+            card["last_review"] = today
+
+        stats.append({
+            "day": day + 1,
+            "active": len(active),
+            "due": len(due),
+            "new": new,
+            "reviews": reviews,
+            "lapses": lapses,
+            "retention": recalled_count / reviews if reviews else None,
+            "sched_ms": sched * 1000,
+        })
+    return stats
+
+
+def simulate_batch(n_cards, days, new_per_day, recall="exponential", seed=0, start=None):
+    """Same simulation on the NumPy engine (sm2_batch + due_mask)."""
+    import numpy as np
+    from sm2_batch import sm2_batch, due_mask
+
+    rng = np.random.default_rng(seed)
+    recall_p = RECALL_MODELS[recall]
+    reps = np.zeros(n_cards, dtype=np.int64)
+    ef = np.full(n_cards, 2.5)
+    interval = np.zeros(n_cards, dtype=np.int64)
+    next_review = np.full(n_cards, np.datetime64("NaT"), dtype="datetime64[D]")
+    last_review = np.full(n_cards, np.datetime64("NaT"), dtype="datetime64[D]")
+    stability = np.full(n_cards, INITIAL_STABILITY)
+    difficulty = rng.uniform(0.5, 2.5, n_cards)
+    start = np.datetime64(start or date.today(), "D")
+    stats = []
+
+    for day in range(days):
+        today = start + day
+        n_active = min(n_cards, (day + 1) * new_per_day)
+
+        t0 = time.perf_counter()
+        idx = np.flatnonzero(due_mask(next_review[:n_active], today))
+        sched = time.perf_counter() - t0
+
+        is_new = np.isnat(last_review[idx])
+        elapsed = np.where(is_new, 0, (today - last_review[idx]).astype(np.int64))
+        if recall == "constant":
+            p = np.full(len(idx), 0.9)
+        else:
+            p = recall_p(elapsed, stability[idx])
+        p = np.where(is_new, FIRST_EXPOSURE_RECALL, p)
+        recalled = rng.random(len(idx)) < p
+        quality = np.where(recalled, np.where(p > 0.9, 5, np.where(p > 0.7, 4, 3)), rng.integers(0, 3, len(idx)))
+
+        t0 = time.perf_counter()
+        result = sm2_batch(quality, reps[idx], ef[idx], interval[idx], today=today)
+        sched += time.perf_counter() - t0
+
+        reps[idx] = result["repetitions"]
+        ef[idx] = result["ease_factor"]
+        interval[idx] = result["interval_days"]
+        next_review[idx] = result["next_review"]
+        grown = stability[idx] * (1 + (3.0 - difficulty[idx]) * (1.5 - p) * 1.8)
+        stability[idx] = np.where(recalled, grown, np.maximum(0.5, stability[idx] * LAPSE_FACTOR))
+        last_review[idx] = today
+
+        seen = ~is_new
+        n_reviews = int(seen.sum())
+        stats.append({
+            "day": day + 1,
+            "active": n_active,
+            "due": len(idx),
+            "new": int(is_new.sum()),
+            "reviews": n_reviews,
+            "lapses": int((seen & ~recalled).sum()),
+            "retention": float((seen & recalled).sum() / n_reviews) if n_reviews else None,
+            "sched_ms": sched * 1000,
+        })
+    return stats
+
+
+def summarize(stats):
+    retention = [s["retention"] for s in stats if s["retention"] is not None]
+    sched = [s["sched_ms"] for s in stats]
+    return {
+        "days": len(stats),
+        "reviews_per_day": statistics.mean(s["due"] for s in stats),
+        "peak_reviews": max(s["due"] for s in stats),
+        "retention": statistics.mean(retention) if retention else None,
+        "sched_ms_total": sum(sched),
+        "sched_ms_p50": statistics.median(sched),
+        "sched_ms_max": max(sched),
+    }
+
+
+def print_report(stats, every=7):
+    print(f"{'jour':>5} {'actives':>9} {'dues':>8} {'new':>6} {'reviews':>8} {'lapses':>7} {'retention':>9} {'ms':>9}")
+    for s in stats:
+        if s["day"] % every and s["day"] != len(stats):
+            continue
+        retention = f"{s['retention'] * 100:.1f}%" if s["retention"] is not None else "-"
+        print(f"{s['day']:>5} {s['active']:>9} {s['due']:>8} {s['new']:>6} {s['reviews']:>8} "
+              f"{s['lapses']:>7} {retention:>9} {s['sched_ms']:>9.2f}")
+    summary = summarize(stats)
+    print(f"\nCharge moyenne: {summary['reviews_per_day']:.0f} cartes/jour (pic {summary['peak_reviews']})")
+    if summary["retention"] is not None:
+        print(f"Retention moyenne: {summary['retention'] * 100:.1f}%")
+    print(f"Calcul: {summary['sched_ms_total']:.0f} ms au total, "
+          f"p50 {summary['sched_ms_p50']:.2f} ms/jour, max {summary['sched_ms_max']:.2f} ms/jour")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Simulate SM-2 review sessions on a synthetic deck")
+    parser.add_argument("--cards", type=int, default=10_000, help="deck size (default: 10000)")
+    parser.add_argument("--days", type=int, default=90, help="days to simulate (default: 90)")
+    parser.add_argument("--new-per-day", type=int, default=None,
+                        help="new cards introduced per day (default: whole deck over the run)")
+    parser.add_argument("--recall", choices=sorted(RECALL_MODELS), default="exponential")
+    parser.add_argument("--scheduler", choices=("sm2", "fsrs"), default="sm2",
+                        help="scheduler for the scalar engine (default: sm2)")
+    parser.add_argument("--engine", choices=("scalar", "batch"), default="scalar",
+                        help="scalar = schedulers.py + get_due_cards(), batch = sm2_batch (numpy, SM-2 only)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--every", type=int, default=7, help="print one line every N days")
+    parser.add_argument("--json", action="store_true", help="print per-day stats and summary as JSON")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    new_per_day = args.new_per_day or max(1, math.ceil(args.cards / args.days))
+    if args.engine == "batch" and args.scheduler != "sm2":
+        print("Le moteur batch ne gere que SM-2")
+        sys.exit(1)
+    started = time.perf_counter()
+    if args.engine == "batch":
+        stats = simulate_batch(args.cards, args.days, new_per_day, recall=args.recall, seed=args.seed)
+    else:
+        stats = simulate(args.cards, args.days, new_per_day, recall=args.recall, seed=args.seed,
+                         scheduler=args.scheduler)
+    wall = time.perf_counter() - started
+
+    if args.json:
+        print(json.dumps({"args": vars(args), "summary": summarize(stats), "days": stats}, indent=2))
+    else:
+        print(f"=== {args.cards} cartes, {args.days} jours, {new_per_day} nouvelles/jour, "
+              f"recall={args.recall}, scheduler={args.scheduler}, engine={args.engine} ===\n")
+        print_report(stats, args.every)
+        print(f"Duree totale: {wall:.1f} s")
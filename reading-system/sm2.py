@@ -1,10 +1,15 @@
 #!/usr/bin/env python3
 """SM-2 Spaced Repetition Algorithm implementation."""
 
+from bisect import bisect_left, bisect_right, insort
 from datetime import datetime, timedelta
 
+# Interval thresholds (days) for the Review and Mastered statuses
+REVIEW_DAYS = 6
+MASTERED_DAYS = 30
 
-def sm2(quality, repetitions=0, ease_factor=2.5, interval=0):
+
+def sm2(quality, repetitions=0, ease_factor=2.5, interval=0, today=None):
     """
     Calculate next review parameters using SM-2 algorithm.
 
@@ -19,6 +24,7 @@ def sm2(quality, repetitions=0, ease_factor=2.5, interval=0):
         repetitions: number of successful reviews (quality >= 3)
         ease_factor: current ease factor (starts at 2.5)
         interval: current interval in days
+        today: date the review happens on (defaults to today)
 
     Returns:
         dict with: repetitions, ease_factor, interval, next_review_date, status
@@ -42,42 +48,114 @@ def sm2(quality, repetitions=0, ease_factor=2.5, interval=0):
             new_interval = round(interval * new_ef)
         new_reps = repetitions + 1
 
-    next_review = datetime.now().date() + timedelta(days=new_interval)
-
-    # Determine status
-    if new_reps == 0:
-        status = "Learning"
-    elif new_interval >= 30:
-        status = "Mastered"
-    elif new_interval >= 6:
-        status = "Review"
-    else:
-        status = "Learning"
+    next_review = (today or datetime.now().date()) + timedelta(days=new_interval)
 
     return {
         "repetitions": new_reps,
         "ease_factor": round(new_ef, 2),
         "interval_days": new_interval,
         "next_review": next_review.isoformat(),
-        "status": status,
+        "status": card_status(new_reps, new_interval),
     }
 
 
-def get_due_cards(cards):
-    """Filter cards that are due for review today or earlier."""
-    today = datetime.now().date()
+def card_status(repetitions, interval):
+    """Notion Status for a card after review. Shared by every scheduler."""
+    if repetitions == 0:
+        return "Learning"
+    if interval >= MASTERED_DAYS:
+        return "Mastered"
+    if interval >= REVIEW_DAYS:
+        return "Review"
+    return "Learning"
+
+
+def get_due_cards(cards, today=None):
+    """Filter cards that are due for review today (or on `today`) or earlier."""
+    today = today or datetime.now().date()
+    today_iso = today.isoformat()
     due = []
     for card in cards:
         next_review = card.get("next_review")
         if not next_review:
             due.append(card)  # New cards are always due
-        else:
-            review_date = datetime.fromisoformat(next_review).date() if isinstance(next_review, str) else next_review
-            if review_date <= today:
+        elif isinstance(next_review, str):
+            # ISO dates compare correctly as strings, no need to parse each one
+            if next_review[:10] <= today_iso:
                 due.append(card)
+        elif next_review <= today:
+            due.append(card)
     return due
 
 
+class DueIndex:
+    """Card IDs bucketed by next-review date, maintained incrementally.
+
+    Dates are ISO strings kept in a sorted list, so "what is due by D" and
+    "how many cards per day over the next N days" cost O(log n + k) instead
+    of a scan of every card. Never-reviewed cards sit in their own bucket and
+    are always due."""
+
+    def __init__(self, items=()):
+        self._dates = []       # sorted bucket dates, excluding new cards
+        self._buckets = {}     # date -> {card_id: None}, insertion ordered
+        self._new = {}
+        self._card_date = {}   # card_id -> date ("" for new cards)
+        for card_id, next_review in items:
+            self.set(card_id, next_review)
+
+    def __len__(self):
+        return len(self._card_date)
+
+    def __contains__(self, card_id):
+        return card_id in self._card_date
+
+    def set(self, card_id, next_review):
+        """Add a card or move it to a new next-review date."""
+        day = (next_review or "")[:10]
+        if card_id in self._card_date and self._card_date[card_id] == day:
+            return
+        self.remove(card_id)
+        self._card_date[card_id] = day
+        if not day:
+            self._new[card_id] = None
+            return
+        bucket = self._buckets.get(day)
+        if bucket is None:
+            bucket = self._buckets[day] = {}
+            insort(self._dates, day)
+        bucket[card_id] = None
+
+    def remove(self, card_id):
+        day = self._card_date.pop(card_id, None)
+        if day is None:
+            return
+        if not day:
+            del self._new[card_id]
+            return
+        bucket = self._buckets[day]
+        del bucket[card_id]
+        if not bucket:
+            del self._buckets[day]
+            del self._dates[bisect_left(self._dates, day)]
+
+    def due(self, day):
+        """IDs due on `day` (ISO string) or earlier: new cards first, then oldest due date first."""
+        ids = list(self._new)
+        for date in self._dates[:bisect_right(self._dates, day)]:
+            ids.extend(self._buckets[date])
+        return ids
+
+    def count_due(self, day):
+        return len(self._new) + sum(len(self._buckets[d]) for d in self._dates[:bisect_right(self._dates, day)])
+
+    def upcoming(self, after, until):
+        """[(date, count)] for review dates in (after, until], both ISO strings."""
+        lo = bisect_right(self._dates, after)
+        hi = bisect_right(self._dates, until)
+        return [(d, len(self._buckets[d])) for d in self._dates[lo:hi]]
+
+
 if __name__ == "__main__":
     # Demo
     print("=== SM-2 Algorithm Demo ===\n")
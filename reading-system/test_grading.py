@@ -0,0 +1,77 @@
+"""Tests for the local answer grading (run with: python -m pytest reading-system)."""
+
+import importlib
+
+import pytest
+
+from grading_cache import normalize
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    # The server reads its secrets at import time
+    secrets = tmp_path_factory.mktemp("secrets")
+    (secrets / "notion").write_text("test\n")
+    (secrets / "anthropic").write_text("test\n")
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setenv("NOTION_TOKEN_FILE", str(secrets / "notion"))
+        mp.setenv("ANTHROPIC_KEY_FILE", str(secrets / "anthropic"))
+        yield importlib.import_module("flashcard_server")
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("  Élément   Chimique ", "element chimique"),
+    ("C++", "c++"),
+    ("-5 °C", "-5 °c"),
+    ("Paris.", "paris"),
+    ("Louis XIV !", "louis xiv"),
+])
+def test_normalize(text, expected):
+    assert normalize(text) == expected
+
+
+def test_normalize_keeps_signs_apart():
+    assert normalize("-5") != normalize("5")
+    assert normalize("C++") != normalize("C")
+
+
+@pytest.mark.parametrize("correct, answer", [
+    ("mitochondrie", "mitochondire"),       # swapped letters
+    ("photosynthese", "photosyntese"),      # dropped letter
+    ("la revolution francaise", "la revolution francaisse"),
+])
+def test_typo_only_accepts_typos_in_long_words(server, correct, answer):
+    assert server.typo_only(correct, answer)
+
+
+@pytest.mark.parametrize("correct, answer", [
+    ("amylase", "amylose"),
+    ("isotope", "isotone"),
+    ("autriche", "autruche"),               # a substituted letter is another word
+    ("louis xiv", "louis xv"),
+    ("12 ans", "13 ans"),
+    ("photosynthese", "photosintese"),      # two edits
+    ("la revolution", "revolution la"),
+])
+def test_typo_only_rejects_other_words(server, correct, answer):
+    assert not server.typo_only(correct, answer)
+
+
+@pytest.mark.parametrize("correct, answer", [
+    ("2", "deux"),
+    ("Etats-Unis", "USA"),
+    ("eau", "H2O"),
+    ("Amylase", "amylose"),
+    ("Isotope", "isotone"),
+    ("Autriche", "Autruche"),
+    ("Louis XIV", "Louis XV"),
+])
+def test_grade_locally_leaves_ambiguous_answers_to_the_model(server, correct, answer):
+    assert server.grade_locally(correct, answer) is None
+
+
+def test_grade_locally_decides_clear_cases(server):
+    assert server.grade_locally("Mitochondrie", "mitochondire")["verdict"] == "correct"
+    assert server.grade_locally("Élément", "element")["verdict"] == "correct"
+    assert server.grade_locally("Photosynthese", "Respiration cellulaire")["verdict"] == "wrong"
+    assert server.grade_locally("Paris", "")["verdict"] == "wrong"
@@ -0,0 +1,26 @@
+"""Tests for schedulers.py (run with: python -m pytest reading-system)."""
+
+from datetime import date
+
+import pytest
+
+from schedulers import FSRSScheduler
+
+
+def test_fsrs_initial_difficulty_matches_fsrs45():
+    # D0(G) = w4 - (G - 3) * w5 with the FSRS-4.5 defaults w4 = 5.1618, w5 = 1.2298
+    fsrs = FSRSScheduler()
+    assert [fsrs.init_difficulty(g) for g in (1, 2, 3, 4)] == pytest.approx([7.6214, 6.3916, 5.1618, 3.932])
+
+
+def test_fsrs_difficulty_reverts_towards_good_not_floor():
+    fsrs = FSRSScheduler()
+    d = fsrs.init_difficulty(3)
+    for _ in range(50):
+        d = fsrs.next_difficulty(d, 3)
+    assert d == pytest.approx(fsrs.init_difficulty(3))
+
+
+def test_fsrs_review_keeps_difficulty_above_floor():
+    card = FSRSScheduler().review({}, 4, today=date(2026, 1, 1))
+    assert card["fsrs_difficulty"] == pytest.approx(5.1618)